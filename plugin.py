@@ -4,15 +4,55 @@
 <plugin key="LUXT2TEST" name="_TEST Luxtronic2 based on sockets." author="ajarzyn" version="0.0.7">
     <description>
         <h2>Luxtronic2 based on sockets.</h2><br/>
+        Advanced options, separated by semicolons:
+        <ul style="list-style-type:square">
+            <li>max_age - seconds after which an unchanged value is published again (300)</li>
+            <li>interval.READ_CALCUL / interval.READ_PARAMS / interval.READ_VISIBI - seconds between reads of
+                calculations (data pull interval), parameters (300, and after every write) and visibilities
+                (0, read once at first start and after firmware updates)</li>
+            <li>schema - device schema file in the plugin folder, listing the controller values shown as devices,
+                their conversion, device type, write rules and translations (devices.json)</li>
+            <li>visibility - 1 leaves out the devices of parts the controller reports as not installed, like
+                the second mixing circuit, cooling or a room sensor, 0 creates all of them (1)</li>
+            <li>adaptive_interval - 1 polls calculations every adaptive_min seconds (5) around state changes,
+                defrost and hot water runs, at the data pull interval while the compressor runs, and backs off up
+                to adaptive_max seconds (300) while there is no requirement (0)</li>
+            <li>poll_timeout / connect_timeout - seconds one poll may take as a whole (10), of which
+                connecting at most (3)</li>
+            <li>breaker_threshold / breaker_max_delay - failed polls in a row after which an unreachable
+                controller is only retried with a growing pause (3), and the longest pause (600). Its devices
+                are marked as timed out meanwhile</li>
+            <li>write_debounce - seconds without a new command before queued writes are sent (1)</li>
+            <li>energy_integration - 1 integrates power into the kWh counters in the plugin, split exactly at
+                mode changes, 0 leaves the integration to Domoticz (1)</li>
+            <li>energy_max_gap / energy_save_interval - longest integrated gap between two samples (900) and
+                seconds between saves of the counters (300)</li>
+            <li>cop_devices - 1 adds COP devices over the last 1 h, 24 h and 30 days, total and per heating
+                and hot water mode, computed from the integrated energy counters (1)</li>
+            <li>record / record_max_size - file every polled calculations and parameters frame is recorded
+                to, for replay with tools/replay_frames.py (none), and size in MB after which it is rotated (100)</li>
+            <li>series / series_retention - file keeping every calculation value at poll resolution, for range
+                queries with tools/query_series.py (none), and hours kept in it (168). The file is allocated
+                once for the retention and then overwritten in a ring</li>
+            <li>stats_devices - 1 adds poll time, poll errors and reconnects devices (0)</li>
+            <li>stats_interval - seconds between poll statistics in the debug log, 0 disables them (300)</li>
+            <li>deadband.&lt;device&gt; - minimal change of the English named device or device type worth
+                publishing, e.g. deadband.Flow=5;deadband.Temperature=0.2</li>
+        </ul>
+        Several heat pumps can be polled by one hardware: list their addresses separated by commas, each
+        optionally with its own port (host:port). They are polled concurrently, the devices of the second
+        and next ones are named with a [2], [3]... prefix. Up to 5 controllers.<br/>
         Be aware:
-         Values greater than 30 seconds will cause a message to be regularly logged about the plugin not responding.
-         The plugin will actually function correctly with values greater than 30 though.
+         The heat pump is polled on a background thread at the data pull interval, values greater
+         than 30 seconds are fine, new data is published to the devices at most every 30 seconds.
+         Parameters are read less often, see the advanced options.
     </description>
     <params>
-        <param field="Address" label="luxtronic2 IP Address" width="200px" required="true" default="127.0.0.1"/>
+        <param field="Address" label="luxtronic2 IP Address(es)" width="200px" required="true" default="127.0.0.1"/>
         <param field="Port" label="luxtronic2 Port" width="30px" required="true" default="8889"/>
 
         <param field="Mode2" label="Data pull interval in seconds" width="150px" default="25"/>
+        <param field="Mode4" label="Advanced options (key=value;...)" width="400px" default=""/>
         <param field="Mode3" label="Lang" width="150px">
             <options>
                 <option label="English" value="0" default="true"/>
@@ -37,64 +77,27 @@
 """
 
 import Domoticz
+import hashlib
+import json
+import mmap
+import os
+import queue
+import random
+import select
 import socket
+import socketserver
 import struct
-import re
+import sys
+import threading
+import time
+from array import array
+from collections import deque, namedtuple
+from operator import itemgetter
+from types import MappingProxyType
 
 
+# Translations of the names used by the code, the devices bring theirs in the device schema.
 _IDS = {
-    'Heat supply temp': [
-        'Temp zasilania',
-        'Aanvoertemp verw'
-    ],
-    'Heat return temp': [
-        'Temp powrotu',
-        'Retourtemp verw'
-    ],
-    'Return temp target': [
-        'Temp powr cel',
-        'Retourtemp doel'
-    ],
-    'Outside temp': [
-        'Temp zewn',
-        'Buitentemp'
-    ],
-    'Outside temp avg': [
-        'Temp zewn śred',
-        'Buitentemp gem'
-    ],
-    'DHW temp': [
-        'Temp cwu',
-        'Temp tapwater'
-    ],
-    'DHW temp target': [
-        'Temp cwu cel',
-        'Tapwater inst'
-    ],
-    'WP source in temp': [
-        'Temp WP źródło wej',
-        'WP bron in temp'
-    ],
-    'WP source out temp': [
-        'Temp WP źródło wyj',
-        'WP bron uit temp'
-    ],
-    'MC1 temp': [
-        'Temp OM1',
-        'Menggroep1 temp'
-    ],
-    'MC1 temp target': [
-        'Temp OM1 cel',
-        'Menggroep1 inst'
-    ],
-    'MC2 temp': [
-        'Temp OM2',
-        'Menggroep2 temp'
-    ],
-    'MC2 temp target': [
-        'Temp OM2 cel',
-        'Menggroep2 inst'
-    ],
     'Heating mode': [
         'Obieg grzewczy',
         'Verwarmen'
@@ -107,10 +110,6 @@ _IDS = {
         'Chłodzenie',
         'Koeling'
     ],
-    'Automat.|2nd h. source|Party|Holidays|Off': [
-        'Automat.|II źr. ciepła|Party|Wakacje|Wył.',
-        'Automatisch|2e warm.opwek|Party|Vakantie|Uit',
-    ],
     'No requirement': [
         'Brak zapotrzebowania',
         'Geen warmtevraag',
@@ -131,61 +130,160 @@ _IDS = {
         'Ogrzewanie z zewnętrznego źródła',
         'Verwarmen 2e warm.opwek'
     ],
-    'Temp +-': [
-        'Temp +-',
-        'Temp +-'
+    'COP 1h': [
+        'COP 1h',
+        'COP 1u'
     ],
-    'Working mode': [
-        'Stan pracy',
-        'Bedrijfsmode'
+    'COP 24h': [
+        'COP 24h',
+        'COP 24u'
     ],
-    'Flow': [
-        'Przepływ',
-        'Debiet'
+    'COP 30d': [
+        'COP 30d',
+        'COP 30d'
     ],
-    'Compressor freq': [
-        'Częst sprężarki',
-        'Compr freq'
+    'COP heating 1h': [
+        'COP grz 1h',
+        'COP verw 1u'
     ],
-    'Room temp': [
-        'Temp pokojowa',
-        'Ruimtetemp act'
+    'COP heating 24h': [
+        'COP grz 24h',
+        'COP verw 24u'
     ],
-    'Room temp target': [
-        'Temp pokoj cel',
-        'Ruimtetemp gew'
+    'COP heating 30d': [
+        'COP grz 30d',
+        'COP verw 30d'
     ],
-    'Power total': [
-        'Pobór mocy',
-        'Energie totaal'
+    'COP DHW 1h': [
+        'COP cwu 1h',
+        'COP warmw 1u'
     ],
-    'Power heating': [
-        'Pobór grz',
-        'Energie verw'
+    'COP DHW 24h': [
+        'COP cwu 24h',
+        'COP warmw 24u'
     ],
-    'Power DHW': [
-        'Pobór cwu',
-        'Energie warmw'
+    'COP DHW 30d': [
+        'COP cwu 30d',
+        'COP warmw 30d'
     ],
-    'Heat out total': [
-        'Moc grz razem',
-        'Verwarm totaal'
+    'Poll time': [
+        'Czas odczytu',
+        'Pollingtijd'
     ],
-    'Heat out heating': [
-        'Moc grz ogrz',
-        'Verwarm verw'
+    'Poll errors': [
+        'Błędy odczytu',
+        'Pollingfouten'
     ],
-    'Heat out DHW': [
-        'Moc grz cwu',
-        'Verwarm warmw'
-    ],
-    'COP total': [
-        'COP razem',
-        'COP totaal'
+    'Reconnects': [
+        'Ponowne połączenia',
+        'Herverbindingen'
     ]
 }
 
-_IDS_STR = str(_IDS)
+# Every name the plugin may have given to a device, a device named otherwise was renamed by the user.
+_IDS_NAMES = set(_IDS).union(*_IDS.values())
+
+DEFAULT_OPTIONS = {
+    'max_age': 300,
+    # Seconds between reads of each socket command, 0 reads once at start.
+    # READ_CALCUL defaults to the data pull interval.
+    'interval.READ_PARAMS': 300,
+    'interval.READ_VISIBI': 0,
+    # 1 leaves out the units the controller visibilities report as not installed.
+    'visibility': 1,
+    # Device schema file, relative to the plugin folder.
+    'schema': 'devices.json',
+    # 1 adapts the calculations interval to the heat pump state, between adaptive_min and adaptive_max seconds.
+    'adaptive_interval': 0,
+    'adaptive_min': 5,
+    'adaptive_max': 300,
+    # Seconds one poll may take as a whole (connect, send and receive), and of that for connecting.
+    'poll_timeout': 10,
+    'connect_timeout': 3,
+    # Failed polls in a row before the controller is left alone, and the longest pause in seconds.
+    'breaker_threshold': 3,
+    'breaker_max_delay': 600,
+    # Seconds without a new command before the queued writes are sent.
+    'write_debounce': 1.0,
+    # 1 integrates power into kWh counters in the plugin, 0 leaves it to Domoticz.
+    'energy_integration': 1,
+    # Longest gap in seconds between two power samples that is still integrated.
+    'energy_max_gap': 900,
+    # Seconds between saves of the energy counters to the plugin configuration.
+    'energy_save_interval': 300,
+    # 1 adds rolling COP devices over the COP_WINDOWS, needs energy_integration.
+    'cop_devices': 1,
+    # File the raw READ_CALCUL/READ_PARAMS frames are recorded to, relative to the plugin folder.
+    'record': '',
+    # Size in MB after which the recording is rotated to <file>.1.
+    'record_max_size': 100,
+    # File keeping every READ_CALCUL index at poll resolution, relative to the plugin folder.
+    'series': '',
+    # Hours of calculations kept in the series file, it is sized for them once.
+    'series_retention': 168,
+    # Port of a local listener answering the controller socket protocol from the latest poll,
+    # 0 disables it. Further controllers listen on the following ports.
+    'proxy_port': 0,
+    # Address the listener binds to, 0.0.0.0 serves the whole network.
+    'proxy_host': '127.0.0.1',
+    # 1 adds poll time (p95) / poll errors / reconnects devices.
+    'stats_devices': 0,
+    # Seconds between poll statistics summaries in the debug log, 0 disables them.
+    'stats_interval': 300,
+}
+
+# Domoticz unit numbers per controller: schema units base and count, COP units base,
+# statistics units base. The first controller keeps the numbers of single controller
+# installs, the others fill the gaps around them, with room for 29 schema units each.
+UNIT_NAMESPACES = (
+    (0, 99, 100, 200),
+    (29, 29, 59, 68),
+    (108, 29, 138, 147),
+    (150, 29, 180, 189),
+    (202, 29, 232, 241),
+)
+
+
+def unit_namespace(namespace: int, controllers: int = 1) -> tuple:
+    """
+    Unit numbers of a controller out of UNIT_NAMESPACES. With several controllers the
+    first one only keeps the schema units below the range of the second one.
+    """
+    bases = UNIT_NAMESPACES[namespace]
+    if namespace == 0 and controllers > 1:
+        bases = (bases[0], UNIT_NAMESPACES[1][0] - bases[0]) + bases[2:]
+    return bases
+
+# Rolling COP windows: name, length in seconds, number of ring buffer buckets.
+COP_WINDOWS = (
+    ('1h', 3600, 60),
+    ('24h', 24 * 3600, 96),
+    ('30d', 30 * 24 * 3600, 120),
+)
+
+# Energy counters feeding the COP windows, (heat out, power) per mode.
+COP_SOURCES = {
+    'COP': ('Heat out total', 'Power total'),
+    'COP heating': ('Heat out heating', 'Power heating'),
+    'COP DHW': ('Heat out DHW', 'Power DHW'),
+}
+
+
+# READ_CALCUL indices holding the firmware version, one character each.
+FIRMWARE_INDICES = slice(81, 91)
+
+# Operating states of ID_WEB_WP_BZ_akt (READ_CALCUL 80) and their texts, by state value.
+(STATE_HEATING, STATE_HOT_WATER, STATE_POOL, STATE_EVU, STATE_DEFROST, STATE_NO_REQUIREMENT,
+ STATE_EXTERNAL_SOURCE, STATE_COOLING) = range(8)
+OPERATING_STATES = ('Heating mode', 'Hot water mode', 'Swimming pool mode / Photovaltaik', 'EVUM', 'Defrost',
+                    'No requirement', 'Heating external source mode', 'Cooling')
+
+
+# Minimal change of a value worth publishing to Domoticz, by English device name or TypeName.
+DEFAULT_DEADBANDS = {
+    'Temperature': 0.1,
+    'Flow': 5,
+}
 
 
 # Read callbacks
@@ -204,11 +302,21 @@ def selector_switch_level_mapping(data_list: list, data_idx: int, mapping: list)
     return {'nValue': int(level), 'sValue': str(level)}
     
     
+def power_and_energy(instant_power: float, counter) -> dict:
+    # Without a counter Domoticz integrates the power itself (EnergyMeterMode 1).
+    energy = f"{counter.wh:.1f}" if counter is not None else 0
+    return {'sValue': f"{instant_power};{energy}"}
+
+
 def to_instant_power(data_list: list, power_data_idx: int, *args) -> dict:
+    """
+    Args:
+        args: [power_idx], optional EnergyCounter integrating this power
+    """
     instant_power = float(data_list[power_data_idx])
-    return {'sValue': f"{instant_power};0"}
+    return power_and_energy(instant_power, args[1] if len(args) > 1 else None)
 
-def to_instant_power_split(data_list: list, power_data_idx: int, additional_data: list) -> dict:
+def to_instant_power_split(data_list: list, power_data_idx: int, additional_data: list, counter=None) -> dict:
     """
     Splits instant power into heating or hot water based on operating mode.
     
@@ -216,6 +324,7 @@ def to_instant_power_split(data_list: list, power_data_idx: int, additional_data
         data_list: Raw data from heat pump
         power_data_idx: Index for power value
         additional_data: [state_idx, valid_states]
+        counter: optional EnergyCounter integrating this power split
     
     Returns:
         Dictionary with sValue formatted for Domoticz cumulative meter
@@ -228,9 +337,9 @@ def to_instant_power_split(data_list: list, power_data_idx: int, additional_data
     
     # If not in a valid state, return 0 power
     if current_state not in valid_states:
-        return {'sValue': f"0;0"}
+        return power_and_energy(0, counter)
         
-    return {'sValue': f"{instant_power};0"}
+    return power_and_energy(instant_power, counter)
 
 
 def to_cop_calculator(data_list: list, indices: int, *args) -> dict:
@@ -246,20 +355,19 @@ def to_cop_calculator(data_list: list, indices: int, *args) -> dict:
         cop = 0
     return {'sValue': str(round(cop, 2))}
 
+def text_state_names() -> dict:
+    """Translated names of operating modes, based on ID_WEB_WP_BZ_akt values."""
+    return {state: ids(text) for state, text in enumerate(OPERATING_STATES)}
+
+
 def to_text_state(data_list: list, data_idx: int, config: list) -> dict:
     """
     Converts heat pump state to text status
+
+    Args:
+        config: [power_idx, power_threshold, mode_names] with mode_names from text_state_names()
     """
-    # Operating modes based on ID_WEB_WP_BZ_akt values
-    mode_names = {
-        0: ids('Heating mode'),      # heating
-        1: ids('Hot water mode'),    # hot water
-        2: ids('Swimming pool mode / Photovaltaik'),
-        3: ids('Cooling'),
-        4: ids('No requirement')     # off/no requirement
-    }
-    
-    power_idx, power_threshold = config
+    power_idx, power_threshold, mode_names = config
     
     # Get current power consumption
     current_power = float(data_list[power_idx])
@@ -272,15 +380,68 @@ def to_text_state(data_list: list, data_idx: int, config: list) -> dict:
     
     # If power consumption is below threshold, return "No requirement"
     if current_power <= power_threshold:
-        return {'nValue': 0, 'sValue': ids('No requirement')}
+        return {'nValue': 0, 'sValue': mode_names[STATE_NO_REQUIREMENT]}
     
     # Map mode to text, with debug
-    state_text = mode_names.get(current_mode, ids('No requirement'))
+    state_text = mode_names.get(current_mode, mode_names[STATE_NO_REQUIREMENT])
     Domoticz.Debug(f"Mapped state text: {state_text}")
     
     return {'nValue': 0, 'sValue': state_text}
 
 
+def to_metric(data_list: list, data_idx: int, metrics, name: str, digits: int, texts=None) -> dict:
+    """
+    Shows a metric of the MetricGraph evaluated for data_list.
+
+    Args:
+        texts: translated texts shown for the metric values 0, 1, ..., other values are shown as numbers
+    """
+    value = metrics.values[name]
+    if texts:
+        return {'nValue': 0, 'sValue': texts[int(value)] if 0 <= value < len(texts) else str(int(value))}
+    return {'sValue': str(round(value, digits))}
+
+
+# Metric functions, called with the values of the metric inputs and its parameters.
+def metric_scale(inputs: list, factor: float) -> float:
+    return inputs[0] * factor
+
+
+def metric_difference(inputs: list, factor: float) -> float:
+    return (inputs[0] - inputs[1]) * factor
+
+
+def metric_ratio(inputs: list, factor: float) -> float:
+    return inputs[0] / inputs[1] * factor if inputs[1] > 0 else 0
+
+
+def metric_product(inputs: list, factor: float) -> float:
+    for value in inputs:
+        factor *= value
+    return factor
+
+
+def metric_when(inputs: list, modes: list) -> float:
+    """The first input while the second one, an operating state, is one of modes, else 0."""
+    return inputs[0] if int(inputs[1]) in modes else 0
+
+
+def metric_state(inputs: list, threshold: float, idle: int) -> int:
+    """The first input, an operating state, while the second one, a power, is above threshold, else idle."""
+    return int(inputs[0]) if inputs[1] > threshold else idle
+
+
+def source_indices(callback, data_idx: int, read_args: list) -> tuple:
+    """Indices of the returned data a read callback depends on."""
+    if callback in (to_text_state, to_instant_power_split):
+        return data_idx, read_args[0][0]
+    if callback is to_cop_calculator:
+        return tuple(read_args[0])
+    if callback is to_metric:
+        return read_args[0].sources[read_args[1]]
+    return (data_idx,)
+
+
 # Write callbacks
 def command_to_number(*_args, Command: str, **_kwargs):
     return 1 if Command == 'On' else 0
@@ -296,8 +457,698 @@ def level_with_divider(divider: float, *_args, Level, **_kwargs):
     return int(Level / divider)
 
 
+# Device schema (see devices.json) conversions and their parameters, with the default
+# of the optional ones. Read conversions map to the read callbacks above, write ones
+# to the write callbacks, "allowed" is a list of values or a {start, stop, step} range.
+REQUIRED = None
+SCHEMA_READ = {
+    'float': {'divider': 1},
+    'number': {'divider': 1},
+    'selector': {},
+    'text_state': {'power_index': REQUIRED, 'threshold': 0.1},
+    'power': {'energy': ''},
+    'power_split': {'state_index': REQUIRED, 'modes': REQUIRED, 'energy': ''},
+    'cop': {'power_index': REQUIRED},
+    'metric': {'metric': REQUIRED, 'digits': 2, 'texts': []},
+}
+# Metric functions with their number of inputs (None for any) and parameters.
+SCHEMA_METRICS = {
+    'scale': (metric_scale, 1, {'factor': 1}),
+    'difference': (metric_difference, 2, {'factor': 1}),
+    'ratio': (metric_ratio, 2, {'factor': 1}),
+    'product': (metric_product, None, {'factor': 1}),
+    'when': (metric_when, 2, {'modes': REQUIRED}),
+    'state': (metric_state, 2, {'threshold': 0.1, 'idle': STATE_NO_REQUIREMENT}),
+}
+SCHEMA_WRITE = {
+    'level': {'divider': REQUIRED, 'allowed': REQUIRED},
+    'selector': {'divider': 10, 'allowed': REQUIRED},
+    'switch': {'allowed': [0, 1]},
+}
+# Checks of the parameter values given in a schema, with what they have to be.
+SCHEMA_PARAMETER_TYPES = {
+    'divider': (lambda value: is_number(value) and value != 0, 'a number other than 0'),
+    'power_index': (lambda value: is_index(value), 'a READ_CALCUL index'),
+    'state_index': (lambda value: is_index(value), 'a READ_CALCUL index'),
+    'threshold': (lambda value: is_number(value), 'a number'),
+    'factor': (lambda value: is_number(value), 'a number'),
+    'modes': (lambda value: isinstance(value, list) and all(is_index(item) for item in value),
+              'a list of operating states'),
+    'energy': (lambda value: isinstance(value, str), 'a text'),
+    'metric': (lambda value: isinstance(value, str), 'a metric name'),
+    'digits': (lambda value: is_index(value), 'a number of digits'),
+    'idle': (lambda value: is_index(value), 'an operating state'),
+    'texts': (lambda value: isinstance(value, list) and all(isinstance(item, str) for item in value),
+              'a list of texts'),
+}
+# Read conversions combining several READ_CALCUL indices or integrating energy from them.
+CALCULATION_CONVERSIONS = {'text_state', 'power', 'power_split', 'cop', 'metric'}
+SCHEMA_DEVICE_KEYS = {'unit', 'name', 'command', 'index', 'read', 'device', 'write', 'visibility'}
+SCHEMA_METRIC_KEYS = {'name', 'function', 'inputs'}
+# Bumped whenever compile_schema output changes, so cached compilations are redone.
+SCHEMA_FORMAT = 2
+LANGUAGES = 2
+
+
+class SchemaError(ValueError):
+    """The device schema does not validate, the message lists every problem."""
+
+
+def is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def is_index(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def allowed_values(allowed):
+    if isinstance(allowed, dict):
+        return range(allowed['start'], allowed['stop'], allowed.get('step', 1))
+    return list(allowed)
+
+
+def conversion_parameters(kind: str, spec, conversions: dict, where: str, errors: list,
+                          field: str = 'conversion', known: set = frozenset()) -> dict:
+    if not isinstance(spec, dict) or not isinstance(spec.get(field), str) or spec[field] not in conversions:
+        errors.append(f"{where}: {kind} needs a {field} out of {', '.join(conversions)}")
+        return {}
+    defaults = conversions[spec[field]]
+    unknown = spec.keys() - defaults.keys() - known - {field}
+    if unknown:
+        errors.append(f"{where}: unknown {kind} parameters {', '.join(sorted(unknown))}")
+    compiled = {field: spec[field]}
+    for key, default in defaults.items():
+        if key not in spec and default is REQUIRED:
+            errors.append(f"{where}: {kind} {field} {spec[field]} needs {key}")
+        elif key in spec and key in SCHEMA_PARAMETER_TYPES and not SCHEMA_PARAMETER_TYPES[key][0](spec[key]):
+            errors.append(f"{where}: {kind} parameter {key} must be {SCHEMA_PARAMETER_TYPES[key][1]}")
+        compiled[key] = spec.get(key, default)
+    return compiled
+
+
+def compile_metrics(raw, errors: list) -> list:
+    """
+    Validates the metric definitions of a schema and sorts them so every metric comes
+    after the metrics it reads, with the READ_CALCUL indices it depends on in sources.
+    """
+    if not isinstance(raw, list):
+        errors.append("metrics must be a list")
+        return []
+    functions = {name: parameters for name, (_, _, parameters) in SCHEMA_METRICS.items()}
+    definitions = {}
+    for number, metric in enumerate(raw):
+        where = f"metric {number + 1} ({metric.get('name') if isinstance(metric, dict) else None})"
+        if not isinstance(metric, dict) or not SCHEMA_METRIC_KEYS <= metric.keys():
+            errors.append(f"{where}: needs {', '.join(sorted(SCHEMA_METRIC_KEYS))}")
+            continue
+        if not isinstance(metric['name'], str) or not metric['name'] or metric['name'] in definitions:
+            errors.append(f"{where}: name must be a text not used by another metric")
+            continue
+        compiled = conversion_parameters('metric', metric, functions, where, errors, 'function', {'name', 'inputs'})
+        inputs = metric['inputs']
+        if not isinstance(inputs, list) or not inputs or \
+                not all(isinstance(item, str) or isinstance(item, int) and item >= 0 for item in inputs):
+            errors.append(f"{where}: inputs must list READ_CALCUL indices and metric names")
+            continue
+        count = SCHEMA_METRICS[compiled['function']][1] if compiled else None
+        if count is not None and len(inputs) != count:
+            errors.append(f"{where}: {compiled['function']} takes {count} inputs")
+        compiled.update(name=metric['name'], inputs=inputs)
+        definitions[metric['name']] = compiled
+
+    ordered = []
+    visiting = set()
+
+    def visit(name: str, path: tuple):
+        metric = definitions[name]
+        if 'sources' in metric:
+            return
+        if name in visiting:
+            errors.append(f"metric {name}: depends on itself through {' -> '.join(path)}")
+            metric['sources'] = []
+            return
+        visiting.add(name)
+        sources = set()
+        for item in metric['inputs']:
+            if isinstance(item, int):
+                sources.add(item)
+            elif item not in definitions:
+                errors.append(f"metric {name}: unknown input {item}")
+            else:
+                visit(item, path + (item,))
+                sources.update(definitions[item].get('sources', ()))
+        visiting.discard(name)
+        metric['sources'] = sorted(sources)
+        ordered.append(metric)
+
+    for name in definitions:
+        visit(name, (name,))
+    return ordered
+
+
+def compile_schema(raw) -> dict:
+    """
+    Validates a device schema and compiles it once: parameter defaults filled in,
+    source indices of every device resolved and deduplicated per socket command.
+
+    Raises:
+        SchemaError: listing every problem found.
+    """
+    if not isinstance(raw, dict) or not isinstance(raw.get('devices'), list):
+        raise SchemaError("the schema needs a devices list")
+    errors = []
+    translations = raw.get('translations', {})
+    if not isinstance(translations, dict):
+        errors.append("translations must map English texts to their translations")
+        translations = {}
+    for text, translated in translations.items():
+        if not isinstance(translated, list) or len(translated) != LANGUAGES or \
+                not all(isinstance(item, str) for item in translated):
+            errors.append(f"translations of {text}: need {LANGUAGES} texts, Polish and Dutch")
+
+    metrics = compile_metrics(raw.get('metrics', []), errors)
+    metric_sources = {metric['name']: metric['sources'] for metric in metrics}
+
+    devices = []
+    units = set()
+    writes = set()
+    indices = {}
+    max_units = UNIT_NAMESPACES[0][1]
+    for number, device in enumerate(raw['devices']):
+        where = f"device {number + 1}"
+        if not isinstance(device, dict):
+            errors.append(f"{where}: must be an object")
+            continue
+        where = f"device {number + 1} ({device.get('name')})"
+        missing = SCHEMA_DEVICE_KEYS - {'write', 'visibility', 'index'} - device.keys()
+        unknown = device.keys() - SCHEMA_DEVICE_KEYS
+        if missing or unknown:
+            errors.append(f"{where}: missing {', '.join(sorted(missing)) or '-'}, "
+                          f"unknown {', '.join(sorted(unknown)) or '-'}")
+            continue
+        # Values are type checked before they are hashed, a list as unit would not be.
+        if not is_index(device['unit']) or not 1 <= device['unit'] <= max_units or device['unit'] in units:
+            errors.append(f"{where}: unit must be a free number in 1-{max_units}")
+        else:
+            units.add(device['unit'])
+        if not isinstance(device['name'], str) or not device['name']:
+            errors.append(f"{where}: name must be a text")
+        command = device['command'] if device['command'] in ('READ_CALCUL', 'READ_PARAMS') else None
+        if command is None:
+            errors.append(f"{where}: command must be READ_CALCUL or READ_PARAMS")
+        # Metric devices read their metric inputs, the others need the index they show.
+        metric = isinstance(device['read'], dict) and device['read'].get('conversion') == 'metric'
+        index = device.get('index')
+        if not (metric and index is None) and not is_index(index):
+            errors.append(f"{where}: index must be a positive number")
+            index = None
+        if not isinstance(device['device'], dict) or not ({'TypeName', 'Type'} & device['device'].keys()):
+            errors.append(f"{where}: device needs the Domoticz TypeName or Type")
+        if not isinstance(device.get('visibility', 0), int):
+            errors.append(f"{where}: visibility must be a READ_VISIBI index")
+
+        read = conversion_parameters('read', device['read'], SCHEMA_READ, where, errors)
+        write = None
+        if 'write' in device:
+            write = conversion_parameters('write', device['write'], SCHEMA_WRITE, where, errors)
+            if command != 'READ_PARAMS':
+                errors.append(f"{where}: only parameters (READ_PARAMS) can be written")
+            elif index in writes:
+                errors.append(f"{where}: only one device can write each parameter")
+            elif index is not None:
+                writes.add(index)
+            try:
+                if write and not allowed_values(write['allowed']):
+                    errors.append(f"{where}: no allowed values to write")
+            except (KeyError, TypeError):
+                errors.append(f"{where}: allowed must be a list or a start/stop/step range")
+        if read.get('conversion') == 'selector' and (not write or write.get('conversion') != 'selector'):
+            errors.append(f"{where}: a selector reads the levels of its selector write")
+        if metric and isinstance(read.get('metric'), str) and read['metric'] not in metric_sources:
+            errors.append(f"{where}: unknown metric {read['metric']}")
+        # The energy integration and the other indices these conversions read are READ_CALCUL ones.
+        if read.get('conversion') in CALCULATION_CONVERSIONS and command == 'READ_PARAMS':
+            errors.append(f"{where}: read conversion {read['conversion']} only works on READ_CALCUL")
+        if errors:
+            # Sources are only resolved for valid devices, the schema is rejected anyway.
+            continue
+
+        sources = [index]
+        if metric:
+            sources = list(metric_sources[read['metric']])
+        elif read.get('conversion') in ('text_state', 'cop'):
+            sources.append(read['power_index'])
+        elif read.get('conversion') == 'power_split':
+            sources.append(read['state_index'])
+        indices.setdefault(command, set()).update(sources)
+
+        compiled = {key: device.get(key) for key in ('unit', 'name', 'command', 'index', 'device')}
+        compiled.update(read=read, write=write, visibility=device.get('visibility'), sources=sources)
+        devices.append(compiled)
+
+    if errors:
+        raise SchemaError('; '.join(errors))
+    return {'translations': translations, 'devices': devices, 'metrics': metrics,
+            'indices': {command: sorted(values) for command, values in indices.items()}}
+
+
+def load_schema(path: str) -> dict:
+    """
+    Returns the compiled device schema of the file at path. The compilation is cached
+    in the plugin configuration keyed by the hash of the file, an unchanged file is not
+    validated again. A file missing or not valid falls back to the last compilation.
+    """
+    cached = load_configuration('schema') or {}
+    try:
+        with open(path, 'rb') as schema_file:
+            content = schema_file.read()
+        digest = f"{SCHEMA_FORMAT}:{hashlib.sha256(content).hexdigest()}"
+        if cached.get('hash') == digest:
+            compiled = cached['compiled']
+        else:
+            compiled = compile_schema(json.loads(content))
+            save_configuration('schema', {'hash': digest, 'compiled': compiled})
+            Domoticz.Log(f"Device schema {path} compiled: {len(compiled['devices'])} devices reading "
+                         f"{sum(len(values) for values in compiled['indices'].values())} values.")
+    except (OSError, ValueError) as msg:
+        compiled = cached.get('compiled', {'translations': {}, 'devices': [], 'metrics': [], 'indices': {}})
+        Domoticz.Error(f"Device schema {path} not usable, "
+                       f"{'keeping the last valid one' if 'compiled' in cached else 'no devices'}. Error: {str(msg)}")
+    add_translations(compiled['translations'])
+    return compiled
+
+
+def firmware(data_list) -> str:
+    return ''.join(chr(code) for code in data_list[FIRMWARE_INDICES] if 0 < code < 128)
+
+
 def ids(text):
-    return _IDS[text][int(Parameters["Mode3"])-1] if int(Parameters["Mode3"]) else text
+    if not int(Parameters["Mode3"]) or text not in _IDS:
+        return text
+    return _IDS[text][int(Parameters["Mode3"])-1]
+
+
+def add_translations(translations: dict):
+    _IDS.update(translations)
+    _IDS_NAMES.update(translations)
+    _IDS_NAMES.update(*translations.values())
+
+
+def parse_options(text: str) -> dict:
+    """
+    Parses 'key=value;key=value' advanced options over DEFAULT_OPTIONS.
+    Numeric values are converted to float, malformed entries are logged and skipped.
+    """
+    options = dict(DEFAULT_OPTIONS)
+    for entry in text.split(';'):
+        if not entry.strip():
+            continue
+        key, separator, value = entry.partition('=')
+        if not separator:
+            Domoticz.Error(f"Ignoring advanced option without value: {entry}")
+            continue
+        key, value = key.strip(), value.strip()
+        try:
+            options[key] = float(value)
+        except ValueError:
+            options[key] = value
+    return options
+
+
+def parse_addresses(text: str, default_port) -> list:
+    """Parses 'host[:port], host[:port], ...' into (host, port) pairs."""
+    addresses = []
+    for item in text.split(','):
+        host, _, port = item.strip().partition(':')
+        if host:
+            addresses.append((host, port.strip() or default_port))
+    return addresses
+
+
+def deadbands(options: dict) -> dict:
+    """Deadbands keyed by translated device name or TypeName, advanced options take precedence."""
+    merged = dict(DEFAULT_DEADBANDS)
+    merged.update((key[len('deadband.'):], value) for key, value in options.items() if key.startswith('deadband.'))
+    return {(ids(key) if key in _IDS else key): value for key, value in merged.items()}
+
+
+def numeric_value(value):
+    try:
+        return float(str(value).split(';')[0])
+    except ValueError:
+        return None
+
+
+class PublishedValues:
+    """
+    Last nValue/sValue published per unit.
+
+    A new value is only worth a Devices update when it differs from the published
+    one by at least the unit deadband, or when the published one is older than max_age.
+    """
+    def __init__(self, max_age: float = DEFAULT_OPTIONS['max_age']):
+        self.max_age = max_age
+        self.deadbands = {}
+        self.values = {}
+
+    def clear(self):
+        self.values.clear()
+
+    def forget(self, unit: int):
+        self.values.pop(unit, None)
+
+    def changed(self, unit: int, values: dict) -> bool:
+        published = self.values.get(unit)
+        if published is None or time.monotonic() - published[2] >= self.max_age:
+            return True
+        n_value, s_value = values.get('nValue'), values.get('sValue')
+        if n_value != published[0]:
+            return True
+        if s_value == published[1]:
+            return False
+        deadband = self.deadbands.get(unit, 0)
+        new, old = numeric_value(s_value), numeric_value(published[1])
+        if not deadband or new is None or old is None:
+            return True
+        # Tolerate float representation error of deadbands equal to the value resolution.
+        return abs(new - old) >= deadband - 1e-9
+
+    def store(self, unit: int, values: dict):
+        self.values[unit] = (values.get('nValue'), values.get('sValue'), time.monotonic())
+
+    def due(self, units) -> float:
+        """Monotonic time the oldest value published for units gets older than max_age."""
+        published = [self.values[unit][2] for unit in units if unit in self.values]
+        return (min(published) if published else time.monotonic()) + self.max_age
+
+    def export(self) -> dict:
+        """Published values with the wall clock time they were published at."""
+        offset = time.time() - time.monotonic()
+        return {str(unit): [n_value, s_value, published_at + offset]
+                for unit, (n_value, s_value, published_at) in self.values.items()}
+
+    def restore(self, saved: dict, units):
+        offset = time.monotonic() - time.time()
+        for unit, (n_value, s_value, published_at) in saved.items():
+            if int(unit) in units:
+                self.values[int(unit)] = (n_value, s_value, published_at + offset)
+
+
+class EnergyCounter:
+    """Wh integrated from one power index, limited to some operating modes if given."""
+    __slots__ = ('name', 'power_idx', 'modes', 'wh')
+
+    def __init__(self, name: str, power_idx: int, modes=None):
+        self.name = name
+        self.power_idx = power_idx
+        self.modes = frozenset(modes) if modes is not None else None
+        self.wh = 0.0
+
+
+class EnergyIntegrator:
+    """
+    Integrates the power readings of READ_CALCUL into Wh counters.
+
+    Each pair of consecutive samples adds the trapezoid of the power over the time
+    between them. When the operating mode changed in between, the switch is placed
+    halfway, the power interpolated linearly, and each half is booked to its mode,
+    so mode split counters do not lose the energy of transitions. Samples further
+    apart than max_gap (plugin stopped, controller unreachable) are not bridged.
+    Runs on the poller thread, the counters are read by the Domoticz thread.
+    """
+    def __init__(self, state_idx: int = 80, max_gap: float = 900):
+        self.state_idx = state_idx
+        self.max_gap = max_gap
+        self.counters = {}
+        self.last = None
+
+    def define(self, name: str, power_idx: int, modes=None) -> EnergyCounter:
+        counter = self.counters.get(name)
+        if counter is None or counter.power_idx != power_idx or counter.modes != (
+                frozenset(modes) if modes is not None else None):
+            wh = counter.wh if counter is not None else 0.0
+            counter = self.counters[name] = EnergyCounter(name, power_idx, modes)
+            counter.wh = wh
+        return counter
+
+    def sample(self, taken_at: float, data_list):
+        state = data_list[self.state_idx]
+        powers = {counter.power_idx: float(data_list[counter.power_idx]) for counter in self.counters.values()}
+        last, self.last = self.last, (taken_at, state, powers)
+        if last is None:
+            return
+        last_at, last_state, last_powers = last
+        elapsed = taken_at - last_at
+        if elapsed <= 0 or elapsed > self.max_gap:
+            return
+
+        hours = elapsed / 3600
+        for counter in self.counters.values():
+            before, after = last_powers.get(counter.power_idx), powers[counter.power_idx]
+            if before is None:
+                continue
+            if counter.modes is None or (last_state == state and state in counter.modes):
+                counter.wh += (before + after) / 2 * hours
+            elif last_state != state:
+                middle = (before + after) / 2
+                if last_state in counter.modes:
+                    counter.wh += (before + middle) / 2 * hours / 2
+                if state in counter.modes:
+                    counter.wh += (middle + after) / 2 * hours / 2
+
+    def export(self) -> dict:
+        return {name: round(counter.wh, 3) for name, counter in self.counters.items()}
+
+    def restore(self, totals: dict):
+        for name, wh in totals.items():
+            if name in self.counters:
+                self.counters[name].wh = float(wh)
+
+
+class CopWindow:
+    """
+    COP over a rolling time window, from the integrated energy counters.
+
+    A fixed size ring keeps the counter totals seen first in each bucket of the
+    window, the COP is the heat out over the power used since the oldest mark still
+    inside the window. Every sample costs O(1) and memory is bounded by the bucket
+    count, whatever the poll rate.
+    """
+    __slots__ = ('name', 'bucket', 'buckets', 'marks')
+
+    def __init__(self, name: str, length: float, buckets: int):
+        self.name = name
+        self.bucket = length / buckets
+        self.buckets = buckets
+        self.marks = deque(maxlen=buckets + 1)
+
+    def sample(self, taken_at: float, totals: tuple):
+        index = int(taken_at // self.bucket)
+        if not self.marks or self.marks[-1][0] != index:
+            self.marks.append((index, totals))
+        # Marks left over from before a gap (plugin stopped) are no longer in the window.
+        while self.marks[0][0] < index - self.buckets:
+            self.marks.popleft()
+
+    def cop(self, totals: tuple, heat_idx: int, power_idx: int) -> float:
+        if not self.marks:
+            return 0
+        start = self.marks[0][1]
+        power = totals[power_idx] - start[power_idx]
+        if power <= 0:
+            return 0
+        return round((totals[heat_idx] - start[heat_idx]) / power, 2)
+
+    def export(self) -> list:
+        return [[index, list(totals)] for index, totals in self.marks]
+
+    def restore(self, marks: list):
+        self.marks.clear()
+        self.marks.extend((int(index), tuple(totals)) for index, totals in marks)
+
+
+class CopWindows:
+    """Rolling COP windows fed by the poller thread, read by the Domoticz thread."""
+    def __init__(self, energy: EnergyIntegrator):
+        self.energy = energy
+        self.lock = threading.Lock()
+        self.counters = [name for sources in COP_SOURCES.values() for name in sources]
+        self.windows = {name: CopWindow(name, length, buckets) for name, length, buckets in COP_WINDOWS}
+
+    def totals(self) -> tuple:
+        return tuple(self.energy.counters[name].wh for name in self.counters)
+
+    def sample(self, taken_at: float):
+        totals = self.totals()
+        with self.lock:
+            for window in self.windows.values():
+                window.sample(taken_at, totals)
+
+    def values(self) -> dict:
+        """COP per 'COP <mode> <window>' English device name."""
+        totals = self.totals()
+        values = {}
+        with self.lock:
+            for window in self.windows.values():
+                for mode, (heat, power) in COP_SOURCES.items():
+                    values[f"{mode} {window.name}"] = window.cop(
+                        totals, self.counters.index(heat), self.counters.index(power))
+        return values
+
+    def export(self) -> dict:
+        with self.lock:
+            return {'counters': self.counters, 'windows': {name: window.export()
+                                                           for name, window in self.windows.items()}}
+
+    def restore(self, saved: dict):
+        # Marks recorded with other counters can not be compared with the current ones.
+        if saved.get('counters') != self.counters:
+            return
+        with self.lock:
+            for name, marks in saved.get('windows', {}).items():
+                if name in self.windows:
+                    self.windows[name].restore(marks)
+
+
+class MetricGraph:
+    """
+    Metrics derived from READ_CALCUL, a DAG of named expressions over raw indices and
+    other metrics as compiled by compile_metrics.
+
+    evaluate() runs once per calculations frame, before the units are converted, and
+    computes each metric at most once. A metric whose inputs did not change keeps its
+    value, so units bound to metrics only add the cost of reading values. Metrics no
+    unit needs, directly or through other metrics, are left out.
+    """
+    __slots__ = ('nodes', 'sources', 'indices', 'pick', 'last', 'values', 'inputs')
+
+    def __init__(self, metrics: list, used=()):
+        needed = set(used)
+        for metric in reversed(metrics):
+            if metric['name'] in needed:
+                needed.update(item for item in metric['inputs'] if isinstance(item, str))
+        self.nodes = []
+        self.sources = {}
+        for metric in metrics:
+            if metric['name'] not in needed:
+                continue
+            function, _, defaults = SCHEMA_METRICS[metric['function']]
+            parameters = tuple(metric[key] for key in defaults)
+            self.nodes.append((metric['name'], function, tuple(metric['inputs']), parameters))
+            self.sources[metric['name']] = tuple(metric['sources'])
+        self.indices = tuple(sorted({idx for sources in self.sources.values() for idx in sources}))
+        self.pick = itemgetter(*self.indices) if len(self.indices) > 1 else \
+            (lambda data_list, _idx=self.indices: tuple(data_list[idx] for idx in _idx))
+        self.last = None
+        # Metric values by name, along with the raw values they were computed from by index.
+        self.values = {}
+        # Input values each metric was last computed from.
+        self.inputs = {}
+
+    def evaluate(self, data_list) -> dict:
+        raw = self.pick(data_list)
+        if raw == self.last:
+            return self.values
+        self.last = raw
+        values = self.values
+        values.update(zip(self.indices, map(float, raw)))
+        inputs = self.inputs
+        for name, function, items, parameters in self.nodes:
+            current = [values[item] for item in items]
+            if inputs.get(name) != current:
+                inputs[name] = current
+                values[name] = function(current, *parameters)
+        return values
+
+
+class Unit:
+    """One Domoticz device fed from one socket command, see prepare_devices_list."""
+    __slots__ = ('id', 'message', 'address', 'data_conversion_callback', '_read_args', 'sources', 'volatile',
+                 'dev_params', 'name', 'write_conversion_callback', '_write_args')
+
+    def __init__(self, domoticz_id, message, address, read_conversion, dev_params, name, write_conversion=None):
+        self.id = domoticz_id
+        self.message = message
+        self.address = address
+        self.data_conversion_callback, *self._read_args = read_conversion
+        self.sources = source_indices(self.data_conversion_callback, address, self._read_args)
+        # Integrated energy grows with time, not only when the source values change.
+        self.volatile = next((arg for arg in self._read_args if isinstance(arg, EnergyCounter)), None)
+
+        self.dev_params = dev_params
+        self.name = name
+        if write_conversion is not None:
+            self.write_conversion_callback, *self._write_args = write_conversion
+        else:
+            self.write_conversion_callback = write_conversion
+
+    def convert(self, data_list) -> dict:
+        return self.data_conversion_callback(data_list, self.address, *self._read_args)
+
+    def update_domoticz_dev(self, data_list, published):
+        values = self.convert(data_list)
+        if published.changed(self.id, values):
+            update_device(Unit=self.id, **values)
+            published.store(self.id, values)
+
+    def prepare_data_to_send(self, **kwargs):
+        return ('WRIT_PARAMS', self.address,
+                self.write_conversion_callback(*self._write_args, **kwargs))
+
+
+class UpdatePlan:
+    """
+    Units reading one socket command, compiled into groups by source index.
+
+    Every poll picks each distinct source index once and converts only the units
+    depending on an index whose raw value changed, plus the ones whose energy counter
+    moved. Once the oldest published value of its units gets older than max_age all
+    units are converted, so PublishedValues republishes the ones that did not change.
+    """
+    __slots__ = ('units', 'volatile', 'energy_seen', 'published', 'indices', 'pick', 'dependents', 'last',
+                 'refresh_due')
+
+    def __init__(self, units: list, published: PublishedValues):
+        dependents = {}
+        for unit in units:
+            for idx in unit.sources:
+                dependents.setdefault(idx, []).append(unit)
+        self.units = tuple(units)
+        self.volatile = tuple(unit for unit in units if unit.volatile is not None)
+        self.energy_seen = {}
+        self.published = published
+        self.indices = tuple(sorted(dependents))
+        self.pick = itemgetter(*self.indices) if len(self.indices) > 1 else \
+            (lambda data_list, _idx=self.indices: tuple(data_list[idx] for idx in _idx))
+        self.dependents = tuple(tuple(dependents[idx]) for idx in self.indices)
+        self.last = None
+        self.refresh_due = 0.0
+
+    def run(self, data_list):
+        values = self.pick(data_list) if self.indices else ()
+        refresh = self.last is None or time.monotonic() >= self.refresh_due
+        if refresh:
+            dirty = self.units
+        else:
+            changed = {}
+            if values != self.last:
+                for value, previous, units in zip(values, self.last, self.dependents):
+                    if value != previous:
+                        changed.update(dict.fromkeys(units))
+            for unit in self.volatile:
+                if unit.volatile.wh != self.energy_seen.get(unit):
+                    changed[unit] = None
+            dirty = changed.keys()
+        self.last = values
+        for unit in self.volatile:
+            self.energy_seen[unit] = unit.volatile.wh
+
+        for unit in dirty:
+            unit.update_domoticz_dev(data_list, self.published)
+        if refresh:
+            # Values published since only get younger, so the refresh is at most early, never late.
+            self.refresh_due = self.published.due([unit.id for unit in self.units])
 
 
 class Field:
@@ -307,6 +1158,8 @@ class Field:
             self.vales = []
         else:
             self.name, self.vales = args
+        # Ranges answer membership in O(1) themselves, anything else is hashed once.
+        self.allowed = self.vales if isinstance(self.vales, range) else frozenset(self.vales)
 
     def get_name(self):
         return self.name
@@ -314,6 +1167,9 @@ class Field:
     def get_val(self):
         return self.vales
 
+    def accepts(self, value) -> bool:
+        return value in self.allowed
+
 
 SOCKET_COMMANDS = {
     'WRIT_PARAMS': 3002,
@@ -322,288 +1178,1696 @@ SOCKET_COMMANDS = {
     'READ_VISIBI': 3005
 }
 
+# Number of big endian int32 words preceding the payload of each reply:
+# echoed command, [status,] payload length. A write reply is the echoed command and value.
+FRAME_HEADER_WORDS = {
+    SOCKET_COMMANDS['WRIT_PARAMS']: 2,
+    SOCKET_COMMANDS['READ_PARAMS']: 2,
+    SOCKET_COMMANDS['READ_CALCUL']: 3,
+    SOCKET_COMMANDS['READ_VISIBI']: 2,
+}
+
+# Typecode of a 4 byte signed int, payload values are decoded into it in bulk.
+INT32_TYPECODE = 'i' if array('i').itemsize == 4 else 'l'
+
+
+def decode_values(buffer) -> array:
+    """Decodes a buffer of big endian int32 values in a single pass."""
+    values = array(INT32_TYPECODE)
+    values.frombytes(buffer)
+    if sys.byteorder == 'little':
+        values.byteswap()
+    return values
+
+
+def encode_values(values: array) -> bytes:
+    """Encodes an int32 array as big endian, the inverse of decode_values."""
+    if sys.byteorder == 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def encode_request(command: int, address: int = 0, value: int = 0) -> bytes:
+    if command == SOCKET_COMMANDS['WRIT_PARAMS']:
+        return struct.pack('!iii', command, address, value)
+    return struct.pack('!ii', command, address)
+
+
+class ProtocolError(ConnectionError):
+    """The byte stream does not match the replies expected, the connection is unusable."""
+
+
+class LuxtronikProtocol:
+    """
+    Incremental parser of controller replies.
+
+    Replies arrive in the order requests were sent, so every sent command is queued
+    with expect(). Bytes are copied into preallocated buffers, first the header of the
+    expected reply and, once its length is known, the whole payload, so frames are
+    reassembled no matter where the transport splits them.
+    Readers owning a socket can recv_into(view()) and call advance() directly.
+    """
+    HEADER = 0
+    PAYLOAD = 1
 
-class BasePlugin:
     def __init__(self):
-        self.active_connection = None
-        self.name = None
-        self.host = None
-        self.port = None
+        self.expected = deque()
+        self.command = None
+        self.state = self.HEADER
+        self.header = None
+        self.buffer = None
+        self.filled = 0
+
+    def reset(self):
+        self.expected.clear()
+        self.command = None
+        self.buffer = None
+        self.filled = 0
+
+    def expect(self, command: int):
+        self.expected.append(command)
+
+    def busy(self) -> bool:
+        return self.command is not None or bool(self.expected)
+
+    def view(self) -> memoryview:
+        """Unfilled part of the buffer the next received bytes belong to."""
+        if self.command is None:
+            if not self.expected:
+                raise ProtocolError("Received data while no reply is expected.")
+            self.command = self.expected.popleft()
+            self.state = self.HEADER
+            self.buffer = bytearray(4 * FRAME_HEADER_WORDS[self.command])
+            self.filled = 0
+        return memoryview(self.buffer)[self.filled:]
+
+    def advance(self, received: int) -> list:
+        """Accounts for bytes written into view(), returns frames completed by them."""
+        self.filled += received
+        if self.filled < len(self.buffer):
+            return []
+
+        if self.state == self.HEADER:
+            self.header = decode_values(self.buffer)
+            if self.header[0] != self.command:
+                raise ProtocolError(f"Expected reply to {self.command} but got {self.header[0]}.")
+            length = self.payload_length()
+            # Visibilities are sent as one signed byte each.
+            item_size = 1 if self.command == SOCKET_COMMANDS['READ_VISIBI'] else 4
+            self.state = self.PAYLOAD
+            self.buffer = bytearray(item_size * length)
+            self.filled = 0
+            if length:
+                return []
+
+        return [self.complete()]
+
+    def payload_length(self) -> int:
+        if self.command in (SOCKET_COMMANDS['READ_PARAMS'], SOCKET_COMMANDS['READ_VISIBI']):
+            return self.header[1]
+        elif self.command == SOCKET_COMMANDS['READ_CALCUL']:
+            return self.header[2]
+        return 0
+
+    def complete(self):
+        command = self.command
+        stat = self.header[1] if command == SOCKET_COMMANDS['READ_CALCUL'] else 0
+        if command == SOCKET_COMMANDS['READ_VISIBI']:
+            data = array('b', self.buffer)
+        else:
+            data = decode_values(self.buffer)
+        self.command = None
+        self.buffer = None
+        return command, stat, len(data), data
+
+    def feed(self, data) -> list:
+        """Consumes a chunk of any size, returns the list of completed frames."""
+        frames = []
+        data = memoryview(data)
+        while data:
+            view = self.view()
+            size = min(len(view), len(data))
+            view[:size] = data[:size]
+            data = data[size:]
+            frames.extend(self.advance(size))
+        return frames
+
+
+def remaining(deadline: float) -> float:
+    """
+    Seconds left until the time.monotonic() deadline.
 
-        self.devices_parameters_list = []
+    Raises:
+        TimeoutError: when the deadline has passed.
+    """
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise TimeoutError("Controller did not answer in time.")
+    return left
 
-        self.units = {}
-        self.available_writes = {}
-        self.dev_lists = {}
-        for command in SOCKET_COMMANDS.keys():
-            self.dev_lists[command] = {}
 
-    def prepare_devices_list(self):
-        self.available_writes = {
-            -1: Field(),
-            1: Field(ids('Temp +-'), [a for a in range(-50, 51, 5)]),
-            3: Field(ids('Heating mode'), [0, 1, 2, 3, 4]),
-            4: Field(ids('Hot water mode'), [0, 1, 2, 3, 4]),
-            105: Field(ids('DHW temp target'), [a for a in range(300, 651, 5)]),
-            108: Field(ids('Cooling'), [0, 1])
-        }
-
-        work_modes_mapping = [(3, ids('Heating mode')),
-                              (4, ids('Hot water mode')),
-                              (2, ids('Swimming pool mode / Photovaltaik')),
-                              (2, ids('EVUM')),
-                              (1, ids('Defrost')),
-                              (0, ids('No requirement')),
-                              (4, ids('Heating external source mode')),
-                              (1, ids('Cooling'))]
-
-        hot_water_temps = '|'.join([str(a / 10) for a in self.available_writes[105].get_val()])
-        heating_temps = '|'.join([str(a / 10) for a in self.available_writes[1].get_val()])
-
-        self.devices_parameters_list = [
-            # 0 Data group/socket command,
-            # 1 idx in returned data,
-            # 2 tuple(data modification callback, list of additional read data (conversion, indexes, relates)),
-            # 3 Domoticz devices dictionary options,
-            # 4 Name of the domoticz device,
-            # 5 tuple(write callback, list of additional write needed data (conversion, indexes))
-            ['READ_CALCUL', 10, (to_float, 10),
-             dict(TypeName='Temperature', Used=1), ids('Heat supply temp')],
-
-            ['READ_CALCUL', 11, (to_float, 10),
-             dict(TypeName='Temperature', Used=1), ids('Heat return temp')],
-
-            ['READ_CALCUL', 12, (to_float, 10),
-             dict(TypeName='Temperature', Used=1), ids('Return temp target')],
-
-            ['READ_CALCUL', 15, (to_float, 10),
-             dict(TypeName='Temperature', Used=1), ids('Outside temp')],
-
-            ['READ_CALCUL', 16, (to_float, 10),
-             dict(TypeName='Temperature', Used=0), ids('Outside temp avg')],
-
-            ['READ_CALCUL', 17, (to_float, 10),
-             dict(TypeName='Temperature', Used=1), ids('DHW temp')],
-
-            ['READ_PARAMS', 105, (to_float, 10),
-            dict(Type=242, Subtype=1, Used=0), ids('DHW temp target'), (level_with_divider, 1/10)],
-
-            ['READ_CALCUL', 19, (to_float, 10),
-             dict(TypeName='Temperature', Used=1), ids('WP source in temp')],
-
-            ['READ_CALCUL', 20, (to_float, 10),
-             dict(TypeName='Temperature', Used=1), ids('WP source out temp')],
-
-            ['READ_CALCUL', 21, (to_float, 10),
-             dict(TypeName='Temperature', Used=0), ids('MC1 temp')],
-
-            ['READ_CALCUL', 22, (to_float, 10),
-             dict(TypeName='Temperature', Used=0), ids('MC1 temp target')],
-            
-            ['READ_CALCUL', 24, (to_float, 10),
-             dict(TypeName='Temperature', Used=0), ids('MC2 temp')],
-
-            ['READ_CALCUL', 25, (to_float, 10),
-             dict(TypeName='Temperature', Used=0), ids('MC2 temp target')],
-
-            ['READ_PARAMS', 3, (selector_switch_level_mapping, self.available_writes[3].get_val()),
-             dict(TypeName='Selector Switch', Image=7, Used=1,
-                  Options={'LevelActions': '|||||',
-                           'LevelNames': ids('Automat.|2nd h. source|Party|Holidays|Off'),
-                           'LevelOffHidden': 'false',
-                           'SelectorStyle': '1'}),
-             ids('Heating mode'), (available_writes_level_with_divider, [10, 3])],
-
-            ['READ_PARAMS', 4, (selector_switch_level_mapping, self.available_writes[4].get_val()),
-             dict(TypeName='Selector Switch', Image=7, Used=1,
-                  Options={'LevelActions': '|||||',
-                           'LevelNames': ids('Automat.|2nd h. source|Party|Holidays|Off'),
-                           'LevelOffHidden': 'false',
-                           'SelectorStyle': '1'}),
-             ids('Hot water mode'), (available_writes_level_with_divider, [10, 4])],
-
-            ['READ_PARAMS', 108, [to_number],
-             dict(TypeName='Switch', Image=9, Used=0), ids('Cooling'), [command_to_number]],
-
-            ['READ_PARAMS', 1, (to_float, 10),
-             dict(Type=242, Subtype=1, Used=0), ids('Temp +-'), (level_with_divider, 1/10)],
-
-            ['READ_CALCUL', 80, (to_text_state, [268, 0.1]),
-             dict(TypeName='Text', Used=1), ids('Working mode')],
-
-            ['READ_CALCUL', 173, (to_float, 1),
-             dict(TypeName='Custom', Used=1, Options={'Custom': '1;l/h'}), ids('Flow')],
-
-            ['READ_CALCUL', 231, (to_float, 1),
-             dict(TypeName='Custom', Used=0, Options={'Custom': '1;Hz'}), ids('Compressor freq')],
-
-            ['READ_CALCUL', 227, (to_float, 10),
-             dict(TypeName='Temperature', Used=0), ids('Room temp')],
-
-            ['READ_CALCUL', 228, (to_float, 10),
-             dict(TypeName='Temperature', Used=0), ids('Room temp target')],
-            
-            # Power consumption
-            ['READ_CALCUL', 268, (to_instant_power, [268]),
-             dict(TypeName='kWh', Used=1,
-                  Options={'EnergyMeterMode': '1'}),
-             ids('Power total')],
-
-            # Power consumption for heating mode
-            ['READ_CALCUL', 268, (to_instant_power_split, [80, [0]]),
-             dict(TypeName='kWh', Used=1,
-                  Options={'EnergyMeterMode': '1'}),
-             ids('Power heating')],
-
-            # Power consumption for hot water mode
-            ['READ_CALCUL', 268, (to_instant_power_split, [80, [1]]),
-             dict(TypeName='kWh', Used=1,
-                  Options={'EnergyMeterMode': '1'}),
-             ids('Power DHW')],
-
-            # Heat output total
-            ['READ_CALCUL', 257, (to_instant_power, [257]),
-             dict(TypeName='kWh', Switchtype=4, Image=15, Used=1,
-                  Options={'EnergyMeterMode': '1'}),
-             ids('Heat out total')],
-
-            # Heat output heating mode
-            ['READ_CALCUL', 257, (to_instant_power_split, [80, [0]]),
-             dict(TypeName='kWh', Switchtype=4, Image=15, Used=1,
-                  Options={'EnergyMeterMode': '1'}),
-             ids('Heat out heating')],
-
-            # Heat output hot water mode
-            ['READ_CALCUL', 257, (to_instant_power_split, [80, [1]]),
-             dict(TypeName='kWh', Switchtype=4, Image=15, Used=1,
-                  Options={'EnergyMeterMode': '1'}),
-             ids('Heat out DHW')],
-
-            # COP calculated over total
-            ['READ_CALCUL', 257, (to_cop_calculator, [257, 268]),
-             dict(TypeName='Custom', Used=1,
-                  Options={'Custom': '1;COP'}),
-             ids('COP total')],
-        ]
-
-        class Unit:
-            def __init__(self, domoticz_id, message, address, read_conversion, dev_params, name, write_conversion=None):
-                self.id = domoticz_id
-                self.message = message
-                self.address = address
-                self.data_conversion_callback, *self._read_args = read_conversion
-
-                self.dev_params = dev_params
-                self.name = name
-                if write_conversion is not None:
-                    self.write_conversion_callback, *self._write_args = write_conversion
-                else:
-                    self.write_conversion_callback = write_conversion
+def read_frame(sock, command: int, stats=None, deadline: float = None):
+    """
+    Reads one complete reply of the controller from a blocking socket.
+
+    Bytes are received straight into the preallocated parser buffers, looping over
+    short reads until the frame is complete. Time spent waiting for bytes and parsing
+    them is accounted to the recv and decode phases of stats, if given. With a
+    deadline, every read waits at most until then.
 
-            def update_domoticz_dev(self, data_list):
-                update_device(Unit=self.id, **self.data_conversion_callback(data_list, self.address, *self._read_args))
+    Returns:
+        Tuple (command, stat, length, data) where data is an int array.
 
-            def prepare_data_to_send(self, **kwargs):
-                return ('WRIT_PARAMS', self.address,
-                        self.write_conversion_callback(*self._write_args, **kwargs))
+    Raises:
+        TimeoutError: when the frame was not complete by the deadline.
+    """
+    protocol = LuxtronikProtocol()
+    protocol.expect(command)
+    recv_time = decode_time = 0.0
+    while True:
+        if deadline is not None:
+            sock.settimeout(remaining(deadline))
+        started = time.perf_counter()
+        received = sock.recv_into(protocol.view())
+        received_at = time.perf_counter()
+        if not received:
+            raise ConnectionError("Connection closed by controller in the middle of a frame.")
+        frames = protocol.advance(received)
+        recv_time += received_at - started
+        decode_time += time.perf_counter() - received_at
+        if frames:
+            if stats is not None:
+                stats.add('recv', recv_time)
+                stats.add('decode', decode_time)
+            return frames[0]
+
+
+class PollStats:
+    """
+    Rolling durations of the poll phases and error counters.
 
-        for dev_idx in range(len(self.devices_parameters_list)):
-            tmp_unit = Unit(dev_idx + 1, *self.devices_parameters_list[dev_idx])
-            tmp_unit.dev_params.update(dict(Name=tmp_unit.name, Unit=tmp_unit.id))
+    Filled by the poller thread (connect, send, recv, decode, poll) and the Domoticz
+    thread (update), read by the latter for the statistics devices and summaries.
+    """
+    PHASES = ('connect', 'send', 'recv', 'decode', 'poll', 'update')
+
+    def __init__(self, window: int = 100):
+        self.lock = threading.Lock()
+        self.durations = {phase: deque(maxlen=window) for phase in self.PHASES}
+        self.errors = 0
+        self.reconnects = 0
+
+    def add(self, phase: str, seconds: float):
+        with self.lock:
+            self.durations[phase].append(seconds)
+
+    def count_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def count_reconnect(self):
+        with self.lock:
+            self.reconnects += 1
+
+    def percentiles(self, phase: str):
+        """Returns (p50, p95, max) of the phase in seconds, None before its first sample."""
+        with self.lock:
+            durations = sorted(self.durations[phase])
+        if not durations:
+            return None
+        return durations[len(durations) // 2], durations[int(0.95 * (len(durations) - 1))], durations[-1]
 
-            self.units[tmp_unit.name] = tmp_unit
-            self.dev_lists[tmp_unit.message][tmp_unit.id] = tmp_unit
-            if tmp_unit.write_conversion_callback is not None:
-                self.dev_lists['WRIT_PARAMS'][tmp_unit.id] = tmp_unit
+    def summary(self) -> str:
+        phases = []
+        for phase in self.PHASES:
+            values = self.percentiles(phase)
+            if values is not None:
+                phases.append(f"{phase} " + "/".join(f"{value * 1000:.1f}" for value in values))
+        return f"Poll stats p50/p95/max ms: {', '.join(phases)}; errors {self.errors}, reconnects {self.reconnects}"
 
-    def create_devices(self):
-        self.prepare_devices_list()
-        for unit in self.units.values():
-            if unit.id not in Devices:
-                Domoticz.Device(**unit.dev_params).Create()
+    def values(self) -> dict:
+        """Statistics devices data: poll time p95 in ms, errors, reconnects."""
+        poll = self.percentiles('poll')
+        return {0: round(poll[1] * 1000, 1) if poll else 0, 1: self.errors, 2: self.reconnects}
 
-            else:
-                # Do not change "Used" option which can be set by user.
-                update_params = unit.dev_params
-                update_params.pop('Used', None)
-                update_device(**update_params)
 
-    def initialize_connection(self):
-        self.active_connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+class LuxtronikSession:
+    """
+    Long lived connection to one controller, reused by every request.
+
+    The controller accepts only a few clients, so the socket is kept open between
+    polls. A socket found closed by the controller, or failing mid request, is
+    reopened and the request is retried once. Requests given a deadline never
+    block past it, connecting takes at most connect_timeout of it.
+    """
+    def __init__(self, host: str, port, stats: PollStats = None, connect_timeout: float = None):
+        self.host = host
+        self.port = int(port)
+        self.sock = None
+        self.stats = stats if stats is not None else PollStats()
+        self.connect_timeout = connect_timeout
+        self.connected_before = False
+
+    def connect(self, deadline: float = None):
+        self.close()
+        timeout = self.connect_timeout
+        if deadline is not None:
+            timeout = min(remaining(deadline), timeout or float('inf'))
+        started = time.perf_counter()
+        self.sock = socket.create_connection((self.host, self.port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.stats.add('connect', time.perf_counter() - started)
+        if self.connected_before:
+            self.stats.count_reconnect()
+        self.connected_before = True
+        Domoticz.Debug(f"Connected to {self.host}:{self.port}")
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            finally:
+                self.sock = None
+
+    def is_alive(self) -> bool:
+        """
+        An idle socket must have nothing to read. Readable means either the controller
+        closed it (EOF) or stale bytes are pending, both make the socket unusable.
+        """
+        if self.sock is None:
+            return False
         try:
-            self.active_connection.connect((self.host, int(self.port)))
-            return True
-        except OSError as msg:
-            self.active_connection.close()
-            Domoticz.Error(f"Connection failed, check ip. Error: {str(msg)}")
+            readable, _, _ = select.select([self.sock], [], [], 0)
+        except (OSError, ValueError):
             return False
+        return not readable
+
+    def exchange(self, command: int, address: int, value: int, deadline: float = None):
+        started = time.perf_counter()
+        self.sock.settimeout(remaining(deadline) if deadline is not None else None)
+        self.sock.sendall(encode_request(command, address, value))
+        self.stats.add('send', time.perf_counter() - started)
+        return read_frame(self.sock, command, self.stats, deadline)
+
+    def request(self, command: int, address: int = 0, value: int = 0, deadline: float = None):
+        """
+        Sends one request and returns the decoded reply, see read_frame.
+
+        Raises:
+            OSError: when the controller can not be reached even after reconnecting,
+                TimeoutError when not by the deadline.
+        """
+        reused = self.is_alive()
+        if not reused:
+            self.connect(deadline)
+        try:
+            return self.exchange(command, address, value, deadline)
+        except OSError as msg:
+            # A reply cut short leaves the stream out of step, never reuse the socket.
+            self.close()
+            if not reused or isinstance(msg, TimeoutError):
+                raise
+            Domoticz.Debug(f"Connection lost ({str(msg)}), reconnecting.")
+            self.connect(deadline)
+            return self.exchange(command, address, value, deadline)
+
+
+class CircuitBreaker:
+    """
+    Stops polling a controller that keeps failing.
 
-    def send_message(self, command, address, value):
-        if self.initialize_connection() is False:
+    After threshold failed polls in a row the breaker opens: the controller is only
+    tried again after a pause doubling with every further failure, up to max_delay,
+    shortened by a random jitter so several plugins do not retry in lockstep. One
+    successful poll closes it. Changed by the poller thread, is_open is read by the
+    Domoticz thread.
+    """
+    def __init__(self, threshold: int = 3, base_delay: float = 30, max_delay: float = 600, jitter: float = 0.2):
+        self.threshold = max(1, int(threshold))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.failures = 0
+        self.retry_at = 0.0
+        self.is_open = False
+
+    def allow(self, now: float) -> bool:
+        return not self.is_open or now >= self.retry_at
+
+    def success(self) -> bool:
+        """Returns True when this closed an open breaker."""
+        was_open = self.is_open
+        self.failures = 0
+        self.is_open = False
+        return was_open
+
+    def failure(self, now: float) -> float:
+        """Returns the pause before the next attempt when the breaker is open, else 0."""
+        self.failures += 1
+        if self.failures < self.threshold:
+            return 0
+        delay = min(self.max_delay, self.base_delay * 2 ** (self.failures - self.threshold))
+        delay *= 1 - self.jitter * random.random()
+        self.retry_at = now + delay
+        self.is_open = True
+        return delay
+
+
+# Immutable result of a poll. frames maps a read command name to (sequence, data) where
+# sequence tells which snapshot last refreshed it and data is a read only int view.
+# WRIT_PARAMS maps to the writes sent for that sequence, {address: value accepted or None}.
+# status maps a read command name to the status word of its last reply (READ_CALCUL has one).
+Snapshot = namedtuple('Snapshot', ['sequence', 'taken_at', 'frames', 'status'], defaults=(MappingProxyType({}),))
+
+
+class SnapshotBuffer:
+    """
+    Double buffer between the poller thread and the Domoticz thread.
+
+    The poller stages decoded frames in the back buffer and publishes them all at
+    once as a new immutable Snapshot, the Domoticz thread only ever reads the front
+    one, so neither side waits on the other beyond swapping one reference.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.front = Snapshot(0, 0.0, MappingProxyType({}))
+        self.back = {}
+        self.back_status = {}
+
+    def stage(self, message: str, data_list, stat: int = 0):
+        self.back[message] = memoryview(data_list).toreadonly()
+        self.back_status[message] = stat
+
+    def restore(self, taken_at: float, frames: dict):
+        """
+        Puts frames saved by a previous run in front as sequence 0, which the Domoticz
+        thread never applies, they are only there until the first poll replaces them.
+        """
+        # Visibilities are kept as one signed byte each, like read_frame decodes them.
+        restored = {message: (0, memoryview(array('b' if message == 'READ_VISIBI' else INT32_TYPECODE,
+                                                  data)).toreadonly())
+                    for message, data in frames.items()}
+        with self.lock:
+            self.front = Snapshot(0, taken_at, MappingProxyType(restored))
+
+    def stage_writes(self, results: dict):
+        self.back['WRIT_PARAMS'] = MappingProxyType(results)
+
+    def publish(self):
+        if not self.back:
             return
+        sequence = self.front.sequence + 1
+        frames = dict(self.front.frames)
+        frames.update((message, (sequence, data)) for message, data in self.back.items())
+        status = dict(self.front.status)
+        status.update(self.back_status)
+        self.back = {}
+        self.back_status = {}
+        with self.lock:
+            self.front = Snapshot(sequence, time.time(), MappingProxyType(frames), MappingProxyType(status))
+
+    def latest(self) -> Snapshot:
+        with self.lock:
+            return self.front
+
+
+class PollSchedule:
+    """
+    Own polling cadence of every read command.
 
-        self.active_connection.send(struct.pack('!i', command))
-        self.active_connection.send(struct.pack('!i', address))
-        if command == SOCKET_COMMANDS['WRIT_PARAMS']:
-            Domoticz.Debug(f"SendMessage {command} {address} {value}")
-            self.active_connection.send(struct.pack('!i', value))
-        if struct.unpack('!i', self.active_connection.recv(4))[0] != command:
-            Domoticz.Debug("Error: REQ_CALCULATED CMD")
-            return None
+    An interval of 0 reads the command once, at start. trigger() makes a command due
+    right away, e.g. READ_PARAMS after a write.
+    """
+    def __init__(self, intervals: dict):
+        self.intervals = dict(intervals)
+        self.due = dict.fromkeys(self.intervals, 0.0)
+        self.retry_delay = min([interval for interval in self.intervals.values() if interval > 0], default=30)
 
-        length = 0
-        stat = 0
+    def trigger(self, message: str):
+        self.due[message] = 0.0
 
-        if command == SOCKET_COMMANDS['READ_PARAMS']:
-            length = struct.unpack('!i', self.active_connection.recv(4))[0]
-        elif command == SOCKET_COMMANDS['READ_CALCUL']:
-            stat = struct.unpack('!i', self.active_connection.recv(4))[0]
-            length = struct.unpack('!i', self.active_connection.recv(4))[0]
-        elif command == SOCKET_COMMANDS['READ_VISIBI']:
-            pass
-        elif command == SOCKET_COMMANDS['WRIT_PARAMS']:
+    def hold(self, message: str):
+        """Keeps the command from being read until it is triggered."""
+        self.due[message] = None
+
+    def defer(self, message: str):
+        """Makes the command due together with the next scheduled read of any command."""
+        others = [due for other, due in self.due.items() if other != message and due is not None]
+        due = min(others, default=time.monotonic() + self.retry_delay)
+        if self.due[message] is None or self.due[message] > due:
+            self.due[message] = due
+
+    def due_messages(self, now: float) -> list:
+        return [message for message, due in self.due.items() if due is not None and due <= now]
+
+    def next_due(self) -> float:
+        return min([due for due in self.due.values() if due is not None], default=float('inf'))
+
+    def done(self, message: str, now: float):
+        interval = self.intervals[message]
+        self.due[message] = now + interval if interval > 0 else None
+
+    def failed(self, message: str, now: float):
+        self.due[message] = now + self.retry_delay
+
+
+class AdaptiveInterval:
+    """
+    Adapts the READ_CALCUL interval of a PollSchedule to the heat pump state.
+
+    Polls every minimum seconds when the operating state changed, the power jumped,
+    during defrost and hot water runs and for a few polls after any of these. While
+    the compressor runs the base interval is used. Idle ("No requirement", EVU block)
+    the interval doubles with every poll up to maximum. Called as a sampler on the
+    poller thread, the new interval applies from the next poll on.
+    """
+    FAST_STATES = frozenset((STATE_HOT_WATER, STATE_DEFROST))
+    IDLE_STATES = frozenset((STATE_EVU, STATE_NO_REQUIREMENT))
+    # Relative power change treated as a transition, and polls kept fast after one.
+    POWER_JUMP = 0.2
+    SETTLE_POLLS = 3
+
+    def __init__(self, schedule: PollSchedule, base: float, minimum: float, maximum: float,
+                 state_idx: int = 80, frequency_idx: int = 231, power_idx: int = 268):
+        self.schedule = schedule
+        self.minimum = max(1.0, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.base = min(max(base, self.minimum), self.maximum)
+        self.state_idx = state_idx
+        self.frequency_idx = frequency_idx
+        self.power_idx = power_idx
+        self.last = None
+        self.settle = 0
+
+    def __call__(self, message: str, taken_at: float, data_list):
+        if message != 'READ_CALCUL' or len(data_list) <= max(self.state_idx, self.frequency_idx, self.power_idx):
+            return
+        current = self.schedule.intervals['READ_CALCUL']
+        interval = self.next_interval(current, data_list[self.state_idx], data_list[self.frequency_idx],
+                                      data_list[self.power_idx])
+        if interval != current:
+            Domoticz.Debug(f"Calculations interval {current:g} -> {interval:g} s")
+            self.schedule.intervals['READ_CALCUL'] = interval
+
+    def next_interval(self, current: float, state: int, frequency: int, power: int) -> float:
+        last, self.last = self.last, (state, power)
+        if last is not None and (state != last[0] or abs(power - last[1]) > self.POWER_JUMP * max(last[1], 1)):
+            self.settle = self.SETTLE_POLLS
+        if self.settle or state in self.FAST_STATES:
+            self.settle = max(0, self.settle - 1)
+            return self.minimum
+        if frequency > 0 or power > 0 or state not in self.IDLE_STATES:
+            return self.base
+        return min(self.maximum, max(current, self.base) * 2)
+
+
+class WriteQueue:
+    """
+    Parameter writes waiting for the poller, coalesced per address.
+
+    Only the last value queued for an address is kept. The writes become ready once
+    no new one arrived for debounce seconds, so dragging a setpoint in the UI ends
+    up as a single write of the final value.
+    """
+    def __init__(self, debounce: float):
+        self.debounce = debounce
+        self.condition = threading.Condition()
+        self.pending = {}
+        self.deadline = None
+
+    def put(self, address: int, value: int):
+        with self.condition:
+            self.pending.pop(address, None)
+            self.pending[address] = value
+            self.deadline = time.monotonic() + self.debounce
+            self.condition.notify()
+
+    def ready(self, now: float) -> bool:
+        return self.deadline is not None and self.deadline <= now
+
+    def take(self) -> dict:
+        with self.condition:
+            pending, self.pending = self.pending, {}
+            self.deadline = None
+            return pending
+
+    def wait(self, due: float, stopping: threading.Event):
+        """Sleeps until due, until the pending writes are ready or until woken up."""
+        with self.condition:
+            if self.deadline is not None:
+                due = min(due, self.deadline)
+            timeout = due - time.monotonic()
+            if timeout > 0 and not stopping.is_set():
+                self.condition.wait(min(timeout, 3600))
+
+    def wake(self):
+        with self.condition:
+            self.condition.notify()
+
+
+class Poller(threading.Thread):
+    """
+    Worker thread owning all controller I/O.
+
+    Reads each command whenever the PollSchedule says it is due and publishes the
+    results as snapshots. Writes queued by onCommand are coalesced by the WriteQueue,
+    sent together once ready and their results published with the next snapshot.
+    They are verified by a READ_PARAMS read-back along with the next scheduled poll.
+    Every poll has to finish within poll_timeout, failing ones feed the breaker,
+    which keeps an unreachable controller from being polled (and logged) over and over.
+    Never touches Devices, that is left to onHeartbeat.
+    """
+    def __init__(self, session: LuxtronikSession, schedule: PollSchedule, snapshots: SnapshotBuffer,
+                 write_debounce: float, samplers: list = (), breaker: CircuitBreaker = None,
+                 poll_timeout: float = None):
+        super().__init__(name='Luxtronik2 poller', daemon=True)
+        self.session = session
+        self.schedule = schedule
+        self.snapshots = snapshots
+        # Called on this thread with (message, taken_at, data_list) after every successful read.
+        self.samplers = list(samplers)
+        self.breaker = breaker if breaker is not None else CircuitBreaker(base_delay=schedule.retry_delay)
+        self.poll_timeout = poll_timeout
+        self.deadline = None
+        self.writes = WriteQueue(write_debounce)
+        self.stopping = threading.Event()
+
+    def stop(self):
+        self.stopping.set()
+        self.writes.wake()
+
+    def write(self, address: int, value: int):
+        self.writes.put(address, value)
+
+    def refresh(self, message: str):
+        """Reads the command with the next poll, whatever its schedule."""
+        self.schedule.trigger(message)
+        self.writes.wake()
+
+    def run(self):
+        while not self.stopping.is_set():
+            due = self.schedule.next_due()
+            if self.breaker.is_open:
+                due = max(due, self.breaker.retry_at)
+            self.writes.wait(due, self.stopping)
+            if self.stopping.is_set():
+                break
+
+            now = time.monotonic()
+            if not self.breaker.allow(now):
+                # Writes to an unreachable controller fail right away, their devices roll back.
+                if self.writes.ready(now):
+                    self.snapshots.stage_writes(dict.fromkeys(self.writes.take()))
+                    self.snapshots.publish()
+                continue
+            self.deadline = now + self.poll_timeout if self.poll_timeout else None
+            if self.writes.ready(now):
+                self.flush(self.writes.take())
+            self.poll(self.schedule.due_messages(time.monotonic()))
+
+        self.session.close()
+
+    def fetch(self, message: str, address: int = 0, value: int = 0):
+        return self.session.request(SOCKET_COMMANDS[message], address, value, self.deadline)
+
+    def failed(self, msg: OSError):
+        self.session.stats.count_error()
+        delay = self.breaker.failure(time.monotonic())
+        if not delay:
+            Domoticz.Error(f"Connection failed, check ip. Error: {str(msg)}")
+        elif self.breaker.failures == self.breaker.threshold:
+            Domoticz.Error(f"Controller {self.session.host} unreachable ({str(msg)}), "
+                           f"retrying with growing pauses, next in {delay:.0f} s.")
+        else:
+            Domoticz.Debug(f"Controller {self.session.host} still unreachable, next try in {delay:.0f} s.")
+
+    def succeeded(self):
+        if self.breaker.success():
+            Domoticz.Log(f"Controller {self.session.host} reachable again.")
+
+    def flush(self, writes: dict):
+        results = {}
+        for address, value in writes.items():
+            Domoticz.Debug(f"SendMessage {SOCKET_COMMANDS['WRIT_PARAMS']} {address} {value}")
+            if not self.breaker.allow(time.monotonic()):
+                results[address] = None
+                continue
+            try:
+                self.fetch('WRIT_PARAMS', address, value)
+                results[address] = value
+                self.succeeded()
+            except OSError as msg:
+                self.failed(msg)
+                results[address] = None
+        self.snapshots.stage_writes(results)
+        self.schedule.defer('READ_PARAMS')
+
+    def poll(self, messages):
+        started = time.perf_counter()
+        for message in messages:
+            if not self.breaker.allow(time.monotonic()):
+                # Opened by an earlier command of this poll, the rest waits for the next attempt.
+                self.schedule.failed(message, time.monotonic())
+                continue
+            try:
+                command, stat, data_length, data_list = self.fetch(message)
+            except OSError as msg:
+                self.failed(msg)
+                self.schedule.failed(message, time.monotonic())
+                continue
+            self.succeeded()
+            taken_at = time.time()
+            for sampler in self.samplers:
+                sampler(message, taken_at, data_list)
+            self.snapshots.stage(message, data_list, stat)
+            self.schedule.done(message, time.monotonic())
+        if messages:
+            self.session.stats.add('poll', time.perf_counter() - started)
+        self.snapshots.publish()
+
+
+class SnapshotProxy(socketserver.ThreadingTCPServer):
+    """
+    Local listener speaking the controller socket protocol (advanced option proxy_port).
+
+    READ_CALCUL/READ_PARAMS/READ_VISIBI are answered from the latest snapshot, so any
+    number of loggers and dashboards share the single connection of the poller. Each
+    reply is encoded once per snapshot. WRIT_PARAMS is checked like a device command
+    and echoed when accepted, the connection is closed otherwise. Accepted
+    writes are queued for the Domoticz thread, which sends them through the write path
+    of the device commands at the next heartbeat, see Controller.apply_proxy_writes.
+
+    Client threads are not daemons: stop() disconnects every client and server_close()
+    waits for their threads, so none outlives the plugin.
+    """
+    daemon_threads = False
+    block_on_close = True
+    allow_reuse_address = True
+    # Seconds a client may stay silent before it is disconnected.
+    idle_timeout = 300
+
+    def __init__(self, address, snapshots: SnapshotBuffer, accepts):
+        super().__init__(address, ProxyHandler)
+        self.snapshots = snapshots
+        # accepts(address, value) tells whether a device command could write it.
+        self.accepts = accepts
+        self.writes = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        # Encoded replies: message -> (sequence of the frame, bytes)
+        self.replies = {}
+        self.messages = {command: message for message, command in SOCKET_COMMANDS.items()}
+        # Sockets of the connected clients, shut down by stop().
+        self.clients = set()
+        self.stopping = False
+
+    def stop(self):
+        """Stops accepting clients and disconnects the connected ones."""
+        self.shutdown()
+        with self.lock:
+            self.stopping = True
+            for client in self.clients:
+                self.disconnect(client)
+
+    @staticmethod
+    def disconnect(client: socket.socket):
+        try:
+            client.shutdown(socket.SHUT_RDWR)
+        except OSError:
             pass
 
-        data_list = []
+    def reply(self, command: int):
+        """Encoded reply to a read command, None without data to answer it."""
+        message = self.messages.get(command)
+        snapshot = self.snapshots.latest()
+        frame = snapshot.frames.get(message) if message != 'WRIT_PARAMS' else None
+        if frame is None:
+            return None
+        sequence, data_list = frame
+        with self.lock:
+            cached = self.replies.get(message)
+            if cached is not None and cached[0] == sequence:
+                return cached[1]
+            if message == 'READ_VISIBI':
+                payload = data_list.tobytes()
+            else:
+                payload = encode_values(array(INT32_TYPECODE, data_list))
+            if message == 'READ_CALCUL':
+                header = struct.pack('!iii', command, snapshot.status.get(message, 0), len(data_list))
+            else:
+                header = struct.pack('!ii', command, len(data_list))
+            self.replies[message] = (sequence, header + payload)
+            return header + payload
+
+    def write(self, address: int, value: int):
+        """Queues an accepted write and returns its reply, None when it is refused."""
+        if not self.accepts(address, value):
+            Domoticz.Error(f"Proxy client write of {value} to parameter {address} refused.")
+            return None
+        self.writes.put((address, value))
+        return struct.pack('!ii', SOCKET_COMMANDS['WRIT_PARAMS'], value)
+
+    def take_writes(self) -> list:
+        writes = []
+        while not self.writes.empty():
+            writes.append(self.writes.get())
+        return writes
+
+
+class ProxyHandler(socketserver.BaseRequestHandler):
+    """One client of the SnapshotProxy, requests are answered in order until it disconnects."""
+    def setup(self):
+        with self.server.lock:
+            self.server.clients.add(self.request)
+            # Accepted just before stop(), its handle() returns right away.
+            if self.server.stopping:
+                self.server.disconnect(self.request)
+
+    def finish(self):
+        with self.server.lock:
+            self.server.clients.discard(self.request)
+
+    def recv_exact(self, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("Proxy client disconnected.")
+            data += chunk
+        return bytes(data)
+
+    def handle(self):
+        self.request.settimeout(self.server.idle_timeout)
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while True:
+                command, address = struct.unpack('!ii', self.recv_exact(8))
+                if command == SOCKET_COMMANDS['WRIT_PARAMS']:
+                    reply = self.server.write(address, struct.unpack('!i', self.recv_exact(4))[0])
+                else:
+                    reply = self.server.reply(command)
+                if reply is None:
+                    return
+                self.request.sendall(reply)
+        except OSError:
+            return
+
 
-        for i in range(length):
-            data_list.append(struct.unpack('!i', self.active_connection.recv(4))[0])
+# Recording file signature, followed by records made of a RECORD_HEADER and payload:
+# record size in bytes, taken_at, socket command, 1 for a keyframe, number of values.
+# A keyframe holds all values, other records the indices (uint16) and new values of the
+# values changed since the previous frame of the command. All big endian.
+RECORD_MAGIC = b'LUXREC1\n'
+RECORD_HEADER = struct.Struct('!IdHBxI')
 
-        self.active_connection.close()
-        return command, stat, length, data_list
 
-    def process_socket_message(self, command='READ_PARAMS', address=0, value=0):
-        if command is 'WRIT_PARAMS':
-            if value not in self.available_writes[address].get_val():
-                Domoticz.Error(f"Incorrect value for {self.available_writes[address].get_name()} value: {value} "
-                               f"but avaialble writables are: {self.available_writes[address].get_val()} for {address}")
+class FrameRecorder:
+    """
+    Appends the READ_CALCUL/READ_PARAMS frames read to a compact binary log.
+
+    Frames are delta encoded against the previous frame of their command, so an
+    unchanged poll costs a header only. Every keyframe_every records of a command,
+    and whenever its length changes, a full keyframe is written instead, which lets
+    FrameLog decode any record from a nearby one. A log larger than max_size bytes is
+    rotated to <path>.1. Called as a sampler on the poller thread.
+    """
+    def __init__(self, path: str, max_size: int = 100 * 1024 * 1024, keyframe_every: int = 256,
+                 messages=('READ_CALCUL', 'READ_PARAMS')):
+        self.path = path
+        self.max_size = max_size
+        self.keyframe_every = keyframe_every
+        self.commands = frozenset(SOCKET_COMMANDS[message] for message in messages)
+        self.file = None
+        self.previous = {}
+        self.since_keyframe = {}
+
+    def __call__(self, message: str, taken_at: float, data_list):
+        command = SOCKET_COMMANDS[message]
+        if command not in self.commands:
+            return
+        try:
+            if self.file is None:
+                self.open()
+            self.write(command, taken_at, data_list)
+            if self.file.tell() >= self.max_size:
+                self.rotate()
+        except OSError as msg:
+            Domoticz.Error(f"Recording to {self.path} failed, recording stopped. Error: {str(msg)}")
+            self.commands = frozenset()
+            self.close()
+
+    def open(self):
+        self.file = open(self.path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(RECORD_MAGIC)
+        # Every log starts with keyframes.
+        self.previous.clear()
+
+    def rotate(self):
+        self.close()
+        os.replace(self.path, self.path + '.1')
+        self.open()
+
+    def close(self):
+        if self.file is not None:
+            try:
+                self.file.close()
+            finally:
+                self.file = None
+
+    def write(self, command: int, taken_at: float, data_list):
+        values = array(INT32_TYPECODE, data_list)
+        previous = self.previous.get(command)
+        recorded = self.since_keyframe.get(command, 0)
+        if previous is None or len(previous) != len(values) or recorded >= self.keyframe_every:
+            keyframe, count = 1, len(values)
+            payload = encode_values(values)
+            self.since_keyframe[command] = 1
+        else:
+            changed = [idx for idx, (value, before) in enumerate(zip(values, previous)) if value != before]
+            keyframe, count = 0, len(changed)
+            indices = array('H', changed)
+            if sys.byteorder == 'little':
+                indices.byteswap()
+            payload = indices.tobytes() + encode_values(array(INT32_TYPECODE, (values[idx] for idx in changed)))
+            self.since_keyframe[command] = recorded + 1
+        self.file.write(RECORD_HEADER.pack(RECORD_HEADER.size + len(payload), taken_at, command, keyframe, count))
+        self.file.write(payload)
+        self.file.flush()
+        self.previous[command] = values
+
+
+class FrameLog:
+    """
+    Memory mapped reader of a FrameRecorder log.
+
+    Opening only indexes the record offsets. frame(n) decodes record n starting from
+    the keyframe before it, iterating decodes every record in order. A record cut
+    short, e.g. by a crash while recording, ends the log.
+    """
+    def __init__(self, path: str):
+        with open(path, 'rb') as log_file:
+            self.map = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(RECORD_MAGIC)] != RECORD_MAGIC:
+            self.map.close()
+            raise ValueError(f"{path} is not a frame recording")
+        self.messages = {command: message for message, command in SOCKET_COMMANDS.items()}
+        self.offsets = []
+        # Record number of the keyframe each record is decoded from.
+        self.keyframes = []
+        keyframes = {}
+        offset = len(RECORD_MAGIC)
+        while offset + RECORD_HEADER.size <= len(self.map):
+            size, _, command, keyframe, _ = RECORD_HEADER.unpack_from(self.map, offset)
+            if size < RECORD_HEADER.size or offset + size > len(self.map):
+                break
+            if keyframe:
+                keyframes[command] = len(self.offsets)
+            if command in keyframes:
+                self.offsets.append(offset)
+                self.keyframes.append(keyframes[command])
+            offset += size
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __iter__(self):
+        """Yields (taken_at, message, values) of every record."""
+        current = {}
+        for number in range(len(self.offsets)):
+            taken_at, command, values = self.apply(number, current)
+            yield taken_at, self.messages[command], values
+
+    def frame(self, number: int):
+        """Returns (taken_at, message, values) of record number."""
+        current = {}
+        taken_at = command = None
+        for other in range(self.keyframes[number], number + 1):
+            taken_at, command, values = self.apply(other, current)
+        return taken_at, self.messages[command], current[command]
+
+    def apply(self, number: int, current: dict):
+        offset = self.offsets[number]
+        size, taken_at, command, keyframe, count = RECORD_HEADER.unpack_from(self.map, offset)
+        start = offset + RECORD_HEADER.size
+        if keyframe:
+            current[command] = decode_values(self.map[start:start + 4 * count])
+        elif command in current:
+            values = current[command] = array(INT32_TYPECODE, current[command])
+            indices = array('H')
+            indices.frombytes(self.map[start:start + 2 * count])
+            if sys.byteorder == 'little':
+                indices.byteswap()
+            for idx, value in zip(indices, decode_values(self.map[start + 2 * count:offset + size])):
+                values[idx] = value
+        return taken_at, command, current.get(command)
+
+    def close(self):
+        self.map.close()
+
+
+# Time series file signature, then a SERIES_HEADER: values per row, row capacity, slot
+# of the next row, rows stored. Rows follow, each a timestamp and the values, big endian.
+SERIES_MAGIC = b'LUXTS01\n'
+SERIES_HEADER = struct.Struct('!IIII')
+SERIES_ROW_TIME = struct.Struct('!d')
+
+
+class SeriesStore:
+    """
+    Fixed size, memory mapped ring of READ_CALCUL frames.
+
+    The file is allocated once for capacity rows of width values and the oldest row
+    is overwritten once it is full, so a write costs one row copy into the map and
+    neither the file nor RAM grows. Rows are kept in time order, range queries find
+    their first row by bisection. With a fixed width, frames longer than width are
+    cut and shorter ones padded with 0. Without one the store is as wide as the frames
+    and, when their length changes (e.g. after a firmware update), the store is moved
+    to <path>.1 and a new one started. Opened with another capacity (the retention or
+    poll interval changed), it keeps its newest rows. Written by the poller thread as a sampler.
+    """
+    def __init__(self, path: str, capacity: int, width: int = None, readonly: bool = False):
+        self.path = path
+        self.capacity = capacity
+        self.width = width
+        self.fixed_width = width is not None
+        self.readonly = readonly
+        self.map = None
+        self.head = 0
+        self.count = 0
+        if readonly or os.path.exists(path):
+            self.open()
+
+    @property
+    def row_size(self) -> int:
+        return SERIES_ROW_TIME.size + 4 * self.width
+
+    def row_offset(self, slot: int) -> int:
+        return len(SERIES_MAGIC) + SERIES_HEADER.size + slot * self.row_size
+
+    def open(self):
+        """
+        Maps an existing store. Unless readonly, one of another capacity is resized keeping
+        its newest rows, and one of another width (or no store at all) is moved to <path>.1.
+        """
+        with open(self.path, 'rb' if self.readonly else 'r+b') as series_file:
+            header = series_file.read(len(SERIES_MAGIC) + SERIES_HEADER.size)
+            width = capacity = None
+            if len(header) == len(SERIES_MAGIC) + SERIES_HEADER.size and header.startswith(SERIES_MAGIC):
+                width, capacity, head, count = SERIES_HEADER.unpack_from(header, len(SERIES_MAGIC))
+                if self.readonly or (capacity == self.capacity and (self.width is None or width == self.width)):
+                    self.width, self.capacity, self.head, self.count = width, capacity, head, count
+                    self.map = mmap.mmap(series_file.fileno(), 0,
+                                         access=mmap.ACCESS_READ if self.readonly else mmap.ACCESS_WRITE)
+                    return
+            if self.readonly:
+                raise ValueError(f"{self.path} is not a series store")
+        if width is not None and (self.width is None or width == self.width):
+            Domoticz.Log(f"Series store {self.path} holds {capacity} polls, now {self.capacity}: "
+                         f"resized keeping the newest polls.")
+            self.resize()
+        else:
+            found = f"holds {width} values, not {self.width}" if width is not None else "is not a series store"
+            Domoticz.Log(f"Series store {self.path} {found}, moved to {self.path}.1 and a new one started.")
+            os.replace(self.path, self.path + '.1')
+
+    def resize(self):
+        """Copies the newest rows of the store at path into a new one of this capacity, then replaces it."""
+        old = SeriesStore(self.path, 0, readonly=True)
+        path, self.path = self.path, self.path + '.new'
+        try:
+            self.create(old.width)
+            for position in range(max(old.count - self.capacity, 0), old.count):
+                offset = old.row_offset(old.slot(position))
+                self.map[self.row_offset(self.head):self.row_offset(self.head + 1)] = \
+                    old.map[offset:offset + old.row_size]
+                self.head = (self.head + 1) % self.capacity
+                self.count += 1
+            SERIES_HEADER.pack_into(self.map, len(SERIES_MAGIC), self.width, self.capacity, self.head, self.count)
+        finally:
+            old.close()
+            self.close()
+            self.path = path
+        os.replace(path + '.new', path)
+        self.open()
+
+    def create(self, width: int):
+        self.width = width
+        with open(self.path, 'w+b') as series_file:
+            series_file.write(SERIES_MAGIC + SERIES_HEADER.pack(width, self.capacity, 0, 0))
+            series_file.truncate(self.row_offset(self.capacity))
+            self.map = mmap.mmap(series_file.fileno(), 0, access=mmap.ACCESS_WRITE)
+        self.head = self.count = 0
+
+    def __call__(self, message: str, taken_at: float, data_list):
+        if message != 'READ_CALCUL':
+            return
+        try:
+            self.append(taken_at, data_list)
+        except (OSError, ValueError) as msg:
+            Domoticz.Error(f"Writing series store {self.path} failed, stopped. Error: {str(msg)}")
+            self.close()
+            self.readonly = True
+
+    def append(self, taken_at: float, data_list):
+        if self.readonly:
+            return
+        if self.map is not None and not self.fixed_width and len(data_list) != self.width:
+            Domoticz.Log(f"Calculations now have {len(data_list)} values instead of {self.width}, "
+                         f"series store {self.path} moved to {self.path}.1 and a new one started.")
+            self.close()
+            os.replace(self.path, self.path + '.1')
+        if self.map is None:
+            self.create(len(data_list) if not self.fixed_width else self.width)
+        values = array(INT32_TYPECODE, data_list[:self.width])
+        if len(values) < self.width:
+            values.extend([0] * (self.width - len(values)))
+        offset = self.row_offset(self.head)
+        SERIES_ROW_TIME.pack_into(self.map, offset, taken_at)
+        self.map[offset + SERIES_ROW_TIME.size:offset + self.row_size] = encode_values(values)
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        SERIES_HEADER.pack_into(self.map, len(SERIES_MAGIC), self.width, self.capacity, self.head, self.count)
+
+    def slot(self, position: int) -> int:
+        """Slot of the row at position, 0 being the oldest row."""
+        return (self.head - self.count + position) % self.capacity
+
+    def time_at(self, position: int) -> float:
+        return SERIES_ROW_TIME.unpack_from(self.map, self.row_offset(self.slot(position)))[0]
+
+    def first_position(self, start: float) -> int:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.time_at(middle) < start:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def rows(self, start: float = None, end: float = None):
+        """Yields (taken_at, values) of the rows taken from start up to end, inclusive."""
+        if self.map is None:
+            return
+        position = self.first_position(start) if start is not None else 0
+        while position < self.count:
+            offset = self.row_offset(self.slot(position))
+            taken_at = SERIES_ROW_TIME.unpack_from(self.map, offset)[0]
+            if end is not None and taken_at > end:
                 return
+            yield taken_at, decode_values(self.map[offset + SERIES_ROW_TIME.size:offset + self.row_size])
+            position += 1
+
+    def series(self, index: int, start: float = None, end: float = None) -> list:
+        """Returns [(taken_at, value)] of one calculation index between start and end."""
+        if self.map is None:
+            return []
+        if not 0 <= index < self.width:
+            raise IndexError(f"Index {index} is not stored, the store keeps indices 0-{self.width - 1}")
+        value_at = struct.Struct('!i')
+        values = []
+        position = self.first_position(start) if start is not None else 0
+        while position < self.count:
+            offset = self.row_offset(self.slot(position))
+            taken_at = SERIES_ROW_TIME.unpack_from(self.map, offset)[0]
+            if end is not None and taken_at > end:
+                break
+            values.append((taken_at, value_at.unpack_from(self.map, offset + SERIES_ROW_TIME.size + 4 * index)[0]))
+            position += 1
+        return values
+
+    def close(self):
+        if self.map is not None:
+            if not self.readonly:
+                self.map.flush()
+            self.map.close()
+            self.map = None
+
+
+class Controller:
+    """
+    One heat pump: its units, poller thread and saved state.
+
+    Each controller owns a namespace of Domoticz units (see UNIT_NAMESPACES) and
+    its own poller, so several controllers are polled concurrently.
+    """
+    def __init__(self, namespace: int = 0, host: str = None, port=None, options: dict = None, schema: dict = None,
+                 controllers: int = 1):
+        self.namespace = namespace
+        self.bases = unit_namespace(namespace, controllers)
+        # Devices of the first controller keep their plain names.
+        self.label = f"[{namespace + 1}] " if namespace else ''
+        self.poller = None
+        self.snapshots = SnapshotBuffer()
+        self.applied_sequence = 0
+        self.timed_out = 0
+        self.recorder = None
+        self.series = None
+        self.proxy = None
+        self.host = host
+        self.port = port
+        self.options = dict(options if options is not None else DEFAULT_OPTIONS)
+        self.published = PublishedValues()
+        self.stats = PollStats()
+        self.stats_units = []
+        self.energy = EnergyIntegrator()
+        self.energy_saved_at = time.monotonic()
+        self.cop = None
+        self.cop_units = []
+        self.stats_logged_at = time.monotonic()
+        # Cached READ_VISIBI block and the firmware it was read from.
+        self.visibility = None
+        self.firmware = None
+
+        # Compiled device schema, see load_schema, and the READ_VISIBI index of the units depending on one.
+        self.schema = schema
+        self.visibility_indices = {}
+        self.table_units = []
+        self.metrics = MetricGraph([])
+
+        self.units = {}
+        self.plans = {}
+        self.write_units = {}
+        # Writes shown on devices but not yet read back: address -> [unit, previous values, value, sequence sent]
+        self.unverified = {}
+        self.available_writes = {}
+        self.dev_lists = {}
+        for command in SOCKET_COMMANDS.keys():
+            self.dev_lists[command] = {}
+
+    def prepare_devices_list(self):
+        if self.schema is None:
+            self.schema = load_schema(os.path.join(Parameters['HomeFolder'], self.options['schema']))
+
+        # Counters integrated by the plugin are reported to Domoticz as is (EnergyMeterMode 0).
+        integrate = bool(self.options['energy_integration'])
+        energy_meter_mode = '0' if integrate else '1'
+
+        published = self.published
+        published.clear()
+        published.max_age = self.options['max_age']
+        unit_deadbands = deadbands(self.options)
+
+        self.available_writes = {-1: Field()}
+        self.metrics = MetricGraph(self.schema.get('metrics', []),
+                                   [device['read']['metric'] for device in self.schema['devices']
+                                    if device['read']['conversion'] == 'metric'])
+        self.visibility_indices = {}
+        self.table_units = []
+        base, size = self.bases[0], self.bases[1]
+        for device in self.schema['devices']:
+            # Units past the range would be the devices of another controller.
+            if device['unit'] > size:
+                Domoticz.Error(f"{self.label}{device['name']} left out, unit {device['unit']} does not fit "
+                               f"the {size} units of each controller when several are configured.")
+                continue
+            name = ids(device['name'])
+            write = device['write']
+            if write is not None:
+                self.available_writes[device['index']] = Field(name, allowed_values(write['allowed']))
+
+            read = device['read']
+            counter = None
+            if read.get('energy') and integrate:
+                counter = self.energy.define(read['energy'], device['index'], read.get('modes'))
+            if read['conversion'] == 'float':
+                read_conversion = (to_float, read['divider'])
+            elif read['conversion'] == 'number':
+                read_conversion = (to_number, read['divider'])
+            elif read['conversion'] == 'selector':
+                read_conversion = (selector_switch_level_mapping, self.available_writes[device['index']].get_val())
+            elif read['conversion'] == 'text_state':
+                read_conversion = (to_text_state, [read['power_index'], read['threshold'], text_state_names()])
+            elif read['conversion'] == 'power':
+                read_conversion = (to_instant_power, [device['index']], counter)
+            elif read['conversion'] == 'power_split':
+                read_conversion = (to_instant_power_split, [read['state_index'], read['modes']], counter)
+            elif read['conversion'] == 'cop':
+                read_conversion = (to_cop_calculator, [device['index'], read['power_index']])
+            else:
+                read_conversion = (to_metric, self.metrics, read['metric'], read['digits'],
+                                   [ids(text) for text in read['texts']])
+
+            write_conversion = None
+            if write is None:
+                pass
+            elif write['conversion'] == 'level':
+                write_conversion = (level_with_divider, write['divider'])
+            elif write['conversion'] == 'selector':
+                write_conversion = (available_writes_level_with_divider, [write['divider'], device['index']])
+            else:
+                write_conversion = (command_to_number,)
+
+            # Option texts, e.g. selector level names, are translated like the names.
+            dev_params = dict(device['device'])
+            if 'Options' in dev_params or read['conversion'] in ('power', 'power_split'):
+                dev_params['Options'] = {key: ids(value) if isinstance(value, str) else value
+                                         for key, value in dev_params.get('Options', {}).items()}
+                if read['conversion'] in ('power', 'power_split'):
+                    dev_params['Options']['EnergyMeterMode'] = energy_meter_mode
+
+            tmp_unit = Unit(base + device['unit'], device['command'], device['index'], read_conversion,
+                            dev_params, self.label + name, write_conversion)
+            tmp_unit.dev_params.update(dict(Name=tmp_unit.name, Unit=tmp_unit.id))
+            published.deadbands[tmp_unit.id] = unit_deadbands.get(
+                name, unit_deadbands.get(dev_params.get('TypeName'), 0))
+            if device['visibility'] is not None:
+                self.visibility_indices[tmp_unit.id] = device['visibility']
+            self.table_units.append(tmp_unit)
+
+        self.cop = None
+        self.cop_units = []
+        if self.options['cop_devices'] and integrate and \
+                all(name in self.energy.counters for sources in COP_SOURCES.values() for name in sources):
+            self.cop = CopWindows(self.energy)
+            for idx, (window, _, _) in enumerate(COP_WINDOWS):
+                for mode_idx, mode in enumerate(COP_SOURCES):
+                    name = f"{mode} {window}"
+                    cop_unit = Unit(self.bases[2] + idx * len(COP_SOURCES) + mode_idx, 'COP', name, (to_float, 1),
+                                    dict(TypeName='Custom', Used=int(mode == 'COP'), Options={'Custom': '1;COP'}),
+                                    self.label + ids(name))
+                    cop_unit.dev_params.update(dict(Name=cop_unit.name, Unit=cop_unit.id))
+                    self.cop_units.append(cop_unit)
+
+        self.stats_units = []
+        if self.options['stats_devices']:
+            for idx, (name, unit_name) in enumerate((('Poll time', 'ms'), ('Poll errors', ''), ('Reconnects', ''))):
+                stats_unit = Unit(self.bases[3] + idx, 'STATS', idx, (to_float, 1),
+                                  dict(TypeName='Custom', Used=1, Options={'Custom': f'1;{unit_name}'}),
+                                  self.label + ids(name))
+                stats_unit.dev_params.update(dict(Name=stats_unit.name, Unit=stats_unit.id))
+                self.stats_units.append(stats_unit)
+
+        self.select_units()
+
+    def visible(self, unit: Unit) -> bool:
+        """Units of optional parts wait for the first visibilities before they are created."""
+        idx = self.visibility_indices.get(unit.id)
+        if idx is None or not self.options['visibility']:
+            return True
+        if self.visibility is None:
+            return False
+        return idx >= len(self.visibility) or self.visibility[idx] != 0
+
+    def select_units(self):
+        """
+        Activates the units of the installed parts only. Units left out are never
+        converted, updated or created, their existing devices are left alone.
+        """
+        self.units = {}
+        self.write_units = {}
+        self.dev_lists = {command: {} for command in SOCKET_COMMANDS}
+        for unit in self.table_units:
+            if not self.visible(unit):
+                continue
+            self.units[unit.id] = unit
+            self.dev_lists[unit.message][unit.id] = unit
+            if unit.write_conversion_callback is not None:
+                self.dev_lists['WRIT_PARAMS'][unit.id] = unit
+                self.write_units[unit.address] = unit
+
+        self.plans = {message: UpdatePlan(list(self.dev_lists[message].values()), self.published)
+                      for message in ('READ_CALCUL', 'READ_PARAMS')}
+
+        for unit in self.cop_units + self.stats_units:
+            self.units[unit.id] = unit
+
+    def create_devices(self):
+        self.prepare_devices_list()
+        # Reconciling every device is only needed when the layout changed since the last start.
+        layout = self.layout()
+        if layout == load_configuration(self.key('layout')) and self.units.keys() <= Devices.keys():
+            Domoticz.Debug(f"{self.label}Device layout unchanged, devices not reconciled.")
+            return
+        self.reconcile()
+        save_configuration(self.key('layout'), layout)
+
+    def layout(self) -> str:
+        """Hash of the Domoticz definitions of the active units."""
+        definitions = repr([(unit_id, self.units[unit_id].dev_params) for unit_id in sorted(self.units)])
+        return hashlib.sha256(definitions.encode()).hexdigest()
+
+    def reconcile(self):
+        """Creates the missing units and repairs the ones whose Domoticz definition drifted."""
+        for unit_id in self.units:
+            self.reconcile_unit(unit_id)
+
+    def reconcile_missing(self):
+        """Recreates the units deleted from Domoticz, leaving the others untouched."""
+        for unit_id in self.units.keys() - Devices.keys():
+            self.reconcile_unit(unit_id)
+
+    def reconcile_unit(self, unit_id: int):
+        unit = self.units[unit_id]
+        if unit_id not in Devices:
+            Domoticz.Device(**unit.dev_params).Create()
+            self.published.forget(unit_id)
+            # Have the next poll convert every unit of the plan, the new one included.
+            if unit.message in self.plans:
+                self.plans[unit.message].last = None
+            return
+
+        # Do not change "Used" option which can be set by user.
+        update_params = dict(unit.dev_params)
+        update_params.pop('Used', None)
+        update_device(**update_params)
+
+    def process_socket_message(self, command='WRIT_PARAMS', address=0, value=0):
+        if address not in self.available_writes or not self.available_writes[address].accepts(value):
+            field = self.available_writes.get(address, self.available_writes[-1])
+            Domoticz.Error(f"Incorrect value for {field.get_name()} value: {value} "
+                           f"but avaialble writables are: {list(field.get_val())} for {address}")
+            return
+        self.poller.write(address, value)
+        self.apply_write(address, value)
+
+    def apply_write(self, address: int, value: int):
+        """
+        Shows an accepted write on its device right away. The value shown before is kept
+        to roll back to, until the write is verified against the controller.
+        """
+        unit = self.write_units.get(address)
+        if unit is None:
+            # Its unit was left out since, e.g. by new visibilities, there is no device to show it on.
+            return
+        published = self.published.values.get(unit.id)
+        if address in self.unverified:
+            previous = self.unverified[address][1]
+        elif published is not None:
+            previous = {'nValue': published[0], 'sValue': published[1]}
         else:
-            address = 0
-            value = 0
+            previous = None
+        self.unverified[address] = [unit, previous, value, None]
+
+        values = unit.convert({address: value})
+        update_device(Unit=unit.id, **values)
+        self.published.store(unit.id, values)
+
+    def track_writes(self, sequence: int, results):
+        for address, accepted in results.items():
+            pending = self.unverified.get(address)
+            if pending is None:
+                continue
+            unit, previous, value, _ = pending
+            if accepted is None:
+                Domoticz.Error(f"Writing {value} to {unit.name} failed, rolling back.")
+                del self.unverified[address]
+                self.published.forget(unit.id)
+                if previous is not None:
+                    update_device(Unit=unit.id, **{key: val for key, val in previous.items() if val is not None})
+                    self.published.store(unit.id, previous)
+            elif accepted == value:
+                pending[3] = sequence
+
+    def verify_writes(self, sequence: int, data_list):
+        """Checks the writes sent up to sequence against the parameters read back."""
+        for address, (unit, previous, value, sent) in list(self.unverified.items()):
+            if sent is None or sent > sequence:
+                continue
+            del self.unverified[address]
+            if data_list[address] != value:
+                Domoticz.Error(f"Controller did not accept {value} for {unit.name}, "
+                               f"it reports {data_list[address]}, rolling back.")
+                self.published.forget(unit.id)
+                unit.update_domoticz_dev(data_list, self.published)
+
+    def update(self, message, data_list):
+        if len(data_list) > 0 and message in self.plans:
+            if message == 'READ_CALCUL' and self.metrics.nodes:
+                self.metrics.evaluate(data_list)
+            self.plans[message].run(data_list)
 
+    def update_all(self):
+        """Applies the parts of the newest snapshot that were not applied yet."""
+        self.reconcile_missing()
+        if self.proxy is not None:
+            self.apply_proxy_writes()
 
+        self.update_stats()
+        self.mark_timed_out()
+
+        snapshot = self.snapshots.latest()
+        if snapshot.sequence == self.applied_sequence:
+            return
+        started = time.perf_counter()
+        frames = snapshot.frames
+        if 'READ_CALCUL' in frames and frames['READ_CALCUL'][0] > self.applied_sequence:
+            self.check_firmware(frames['READ_CALCUL'][1])
+        if 'READ_VISIBI' in frames and frames['READ_VISIBI'][0] > self.applied_sequence:
+            self.apply_visibility(frames['READ_VISIBI'][1])
+        # Writes first, a read-back published along with them was read after them.
+        if 'WRIT_PARAMS' in frames and frames['WRIT_PARAMS'][0] > self.applied_sequence:
+            self.track_writes(*frames['WRIT_PARAMS'])
+        for message, (sequence, data_list) in frames.items():
+            if sequence > self.applied_sequence and message != 'WRIT_PARAMS':
+                self.update(message, data_list)
+        if self.unverified and 'READ_PARAMS' in frames and frames['READ_PARAMS'][0] > self.applied_sequence:
+            self.verify_writes(*frames['READ_PARAMS'])
+        self.update_cop()
+        self.applied_sequence = snapshot.sequence
+        self.stats.add('update', time.perf_counter() - started)
+
+    def mark_timed_out(self):
+        """Marks the controller data devices as timed out while the controller is unreachable."""
+        timed_out = int(self.poller is not None and self.poller.breaker.is_open)
+        if timed_out == self.timed_out:
+            return
+        self.timed_out = timed_out
+        for message in ('READ_CALCUL', 'READ_PARAMS'):
+            for unit_id in self.dev_lists[message]:
+                update_device(Unit=unit_id, TimedOut=timed_out)
+
+    def check_firmware(self, data_list):
+        """Reads the visibilities again once the controller runs another firmware."""
+        if len(data_list) < FIRMWARE_INDICES.stop:
+            return
+        version = firmware(data_list)
+        if version == self.firmware:
+            return
+        if self.firmware is not None and self.poller is not None:
+            Domoticz.Log(f"{self.label}Firmware changed from {self.firmware} to {version}, reading visibilities again.")
+            self.poller.refresh('READ_VISIBI')
+        self.firmware = version
+
+    def apply_visibility(self, data_list):
+        visibility = list(data_list)
+        save_configuration(self.key('visibility'), {'firmware': self.firmware, 'values': visibility})
+        if visibility == self.visibility:
+            return
+        self.visibility = visibility
+        before = self.units.keys()
+        self.select_units()
+        # Units shown now were not reconciled at start, the saved layout has to cover them.
+        for unit_id in self.units.keys() - before:
+            self.reconcile_unit(unit_id)
+        save_configuration(self.key('layout'), self.layout())
+        hidden = [unit.name for unit in self.table_units if unit.id in before and unit.id not in self.units]
+        Domoticz.Debug(f"{self.label}Visibilities read for firmware {self.firmware}, {len(self.units)} units active.")
+        if hidden:
+            Domoticz.Log(f"{self.label}Not installed according to the controller, no longer updated: {', '.join(hidden)}")
+
+    def restore_visibility(self) -> bool:
+        """Restores the visibilities cached in the plugin configuration, True when there were some."""
+        cached = load_configuration(self.key('visibility'))
+        if not cached or not cached.get('values'):
+            return False
+        self.visibility = list(cached['values'])
+        self.firmware = cached.get('firmware')
+        return True
+
+    def update_cop(self):
+        if self.cop_units:
+            values = self.cop.values()
+            for unit in self.cop_units:
+                unit.update_domoticz_dev(values, self.published)
+
+    def update_stats(self):
+        if self.stats_units:
+            values = self.stats.values()
+            for unit in self.stats_units:
+                unit.update_domoticz_dev(values, self.published)
+
+        interval = self.options['stats_interval']
+        if interval and time.monotonic() - self.stats_logged_at >= interval:
+            self.stats_logged_at = time.monotonic()
+            Domoticz.Debug(self.label + self.stats.summary())
+
+    def key(self, name: str) -> str:
+        """Plugin configuration key of this controller."""
+        return f"{name}.{self.namespace + 1}" if self.namespace else name
+
+    def start(self):
+        cached_visibility = self.restore_visibility()
+        self.create_devices()
+        self.restore_energy()
+        self.restore_snapshot()
+
+        schedule = PollSchedule({message: self.options[f'interval.{message}']
+                                 for message in SOCKET_COMMANDS if message != 'WRIT_PARAMS'})
+        # Visibilities only change with the firmware, check_firmware asks for them again then.
+        if cached_visibility and not self.options['interval.READ_VISIBI']:
+            schedule.hold('READ_VISIBI')
+        samplers = self.samplers()
+        if self.options['adaptive_interval']:
+            samplers.append(AdaptiveInterval(schedule, self.options['interval.READ_CALCUL'],
+                                             self.options['adaptive_min'], self.options['adaptive_max']))
+        breaker = CircuitBreaker(self.options['breaker_threshold'], schedule.retry_delay,
+                                 self.options['breaker_max_delay'])
+        session = LuxtronikSession(self.host, self.port, self.stats, self.options['connect_timeout'])
+        self.poller = Poller(session, schedule, self.snapshots, self.options['write_debounce'], samplers,
+                             breaker, self.options['poll_timeout'])
+        self.poller.name = f"Luxtronik2 poller {self.host}"
+        self.poller.start()
+        if self.options['proxy_port']:
+            self.start_proxy()
+
+    def start_proxy(self):
+        address = (self.options['proxy_host'], int(self.options['proxy_port']) + self.namespace)
         try:
-            raw_data = self.send_message(SOCKET_COMMANDS[command], address, value)
-        except socket.error:
-            if self.initialize_connection():
-                raw_data = self.send_message(SOCKET_COMMANDS[command], address, value)
+            self.proxy = SnapshotProxy(address, self.snapshots, self.accepts_write)
+        except OSError as msg:
+            Domoticz.Error(f"{self.label}Proxy can not listen on {address[0]}:{address[1]}. Error: {str(msg)}")
+            return
+        threading.Thread(target=self.proxy.serve_forever, name=f"Luxtronik2 proxy {self.host}",
+                         daemon=True).start()
+        Domoticz.Log(f"{self.label}Proxy listening on {address[0]}:{address[1]}.")
+
+    def accepts_write(self, address: int, value: int) -> bool:
+        """Whether a write is allowed, to the parameters of installed units only like device commands."""
+        return address in self.write_units and self.available_writes[address].accepts(value)
+
+    def apply_proxy_writes(self):
+        """Sends the writes of proxy clients like device commands, they are shown on their devices too."""
+        for address, value in self.proxy.take_writes():
+            Domoticz.Debug(f"{self.label}Proxy client writes {value} to parameter {address}.")
+            self.process_socket_message(address=address, value=value)
+
+    def samplers(self) -> list:
+        samplers = []
+        if self.energy.counters:
+            self.energy.max_gap = self.options['energy_max_gap']
+            samplers.append(lambda message, taken_at, data_list:
+                            self.energy.sample(taken_at, data_list) if message == 'READ_CALCUL' else None)
+        if self.cop is not None:
+            samplers.append(lambda message, taken_at, data_list:
+                            self.cop.sample(taken_at) if message == 'READ_CALCUL' else None)
+        if self.options['record']:
+            self.recorder = FrameRecorder(self.key(os.path.join(Parameters['HomeFolder'], self.options['record'])),
+                                          int(self.options['record_max_size'] * 1024 * 1024))
+            samplers.append(self.recorder)
+        if self.options['series']:
+            # Sized for the shortest interval polls can run at, so the retention holds.
+            interval = self.options['interval.READ_CALCUL']
+            if self.options['adaptive_interval']:
+                interval = min(interval, self.options['adaptive_min'])
+            capacity = int(self.options['series_retention'] * 3600 / max(interval, 1)) + 1
+            self.series = SeriesStore(self.key(os.path.join(Parameters['HomeFolder'], self.options['series'])),
+                                      capacity)
+            samplers.append(self.series)
+        return samplers
+
+    def restore_energy(self):
+        """
+        Restores the energy counters and COP windows saved in the plugin configuration.
+        Counters never saved continue from the total their device shows, so switching
+        from Domoticz side integration does not reset the meter history.
+        """
+        if not self.energy.counters:
+            return
+        saved = load_configuration(self.key('energy'), {})
+        self.energy.restore(saved)
+        if self.cop is not None:
+            self.cop.restore(load_configuration(self.key('cop'), {}))
+        for unit in self.units.values():
+            for counter in unit._read_args:
+                if isinstance(counter, EnergyCounter) and counter.name not in saved and unit.id in Devices:
+                    total = str(Devices[unit.id].sValue).split(';')
+                    if len(total) > 1 and numeric_value(total[1]) is not None:
+                        counter.wh = numeric_value(total[1])
+
+    def save_energy(self, force: bool = False):
+        if not self.energy.counters:
+            return
+        if force or time.monotonic() - self.energy_saved_at >= self.options['energy_save_interval']:
+            self.energy_saved_at = time.monotonic()
+            save_configuration(self.key('energy'), self.energy.export())
+            if self.cop is not None:
+                save_configuration(self.key('cop'), self.cop.export())
+
+    def stop(self):
+        if self.proxy is not None:
+            self.proxy.stop()
+        if self.poller is not None:
+            self.poller.stop()
+
+    def join(self):
+        if self.proxy is not None:
+            # Waits for the client threads, stop() disconnected them.
+            self.proxy.server_close()
+            self.proxy = None
+        if self.poller is not None:
+            self.poller.join(timeout=10)
+            self.poller = None
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.series is not None:
+            self.series.close()
+        self.save_energy(force=True)
+        self.save_snapshot()
+
+    def save_snapshot(self):
+        """Saves the last snapshot and the values published from it for the next start."""
+        snapshot = self.snapshots.latest()
+        frames = {message: list(data) for message, (_, data) in snapshot.frames.items()
+                  if message in ('READ_CALCUL', 'READ_PARAMS')}
+        if frames:
+            save_configuration(self.key('snapshot'), {'taken_at': snapshot.taken_at, 'frames': frames,
+                                                      'published': self.published.export()})
+
+    def restore_snapshot(self):
+        """
+        Warms up the change cache with the values published before the restart, so the
+        first poll only updates the devices whose value changed meanwhile. The cached
+        visibilities join the frames, READ_VISIBI is not polled again while they are valid.
+        """
+        saved = load_configuration(self.key('snapshot')) or {}
+        self.published.restore(saved.get('published', {}), self.units)
+        frames = dict(saved.get('frames', {}))
+        if self.visibility is not None:
+            frames['READ_VISIBI'] = self.visibility
+        if frames:
+            self.snapshots.restore(saved.get('taken_at', 0.0), frames)
+
+    def command(self, Unit, Command, Level, Hue):
+        argument_list = locals()
+        argument_list.pop('self', None)
 
-        if raw_data is None:
-            Domoticz.Error(f"Connection error.")
-            raw_data = command, 0, 0, 0
+        self.process_socket_message(
+            *self.dev_lists['WRIT_PARAMS'][Unit].prepare_data_to_send(
+                available_writes=self.available_writes,
+                **argument_list))
 
-        return raw_data
+    def heartbeat(self):
+        self.update_all()
+        self.save_energy()
 
-    def update(self, message):
-        command, stat, data_length, data_list = self.process_socket_message(message)
-        if data_length > 0:
-            for device in self.dev_lists[message].values():
-                device.update_domoticz_dev(data_list)
 
-    def update_all(self):
-        self.update('READ_CALCUL')
-        self.update('READ_PARAMS')
+class BasePlugin:
+    """Domoticz callbacks, handed to one Controller per configured address."""
+    def __init__(self):
+        self.name = None
+        self.interval = None
+        self.options = dict(DEFAULT_OPTIONS)
+        self.controllers = []
+
+    def owner(self, unit_id: int):
+        return next((controller for controller in self.controllers if unit_id in controller.units), None)
+
+    def reconcile_unit(self, unit_id: int):
+        controller = self.owner(unit_id)
+        if controller is not None:
+            controller.reconcile_unit(unit_id)
 
     def onStart(self):
         if Parameters["Mode6"] != "0":
@@ -611,26 +2875,37 @@ class BasePlugin:
             dump_config_to_log()
 
         self.name = Parameters['Name']
-        self.host = Parameters['Address']
-        self.port = Parameters['Port']
-
-        Domoticz.Heartbeat(int(Parameters['Mode2']))
-
-        self.create_devices()
-
-        if self.initialize_connection() is False:
-            return
-
-        self.update_all()
+        self.options = parse_options(Parameters['Mode4'])
+        self.options.setdefault('interval.READ_CALCUL', float(Parameters['Mode2']))
+        self.interval = self.options['interval.READ_CALCUL']
+
+        # The heartbeat only publishes, polling runs on its own schedule in the pollers.
+        fastest = min(self.interval, self.options['adaptive_min']) if self.options['adaptive_interval'] else self.interval
+        Domoticz.Heartbeat(max(1, min(int(fastest), 30)))
+
+        addresses = parse_addresses(Parameters['Address'], Parameters['Port'])
+        if len(addresses) > len(UNIT_NAMESPACES):
+            Domoticz.Error(f"Only {len(UNIT_NAMESPACES)} controllers fit in one hardware, "
+                           f"ignoring {', '.join(host for host, _ in addresses[len(UNIT_NAMESPACES):])}")
+            addresses = addresses[:len(UNIT_NAMESPACES)]
+        schema = load_schema(os.path.join(Parameters['HomeFolder'], self.options['schema']))
+        self.controllers = [Controller(namespace, host, port, self.options, schema, len(addresses))
+                            for namespace, (host, port) in enumerate(addresses)]
+        for controller in self.controllers:
+            controller.start()
 
     def onStop(self):
         Domoticz.Debug("onStop - Plugin is stopping.")
-        self.active_connection.close()
-        self.active_connection = None
+        # Stop all pollers first, so they wind down together.
+        for controller in self.controllers:
+            controller.stop()
+        for controller in self.controllers:
+            controller.join()
 
     def onDisconnect(self, Connection):
         Domoticz.Debug(f"onDisconnect called for connection to: {Connection.Address}:{Connection.Port}")
 
+    # No Domoticz.Connection is opened, the pollers use their own sockets (see README, Transport).
     def onConnect(self, Connection, status, Description):
         Domoticz.Debug(f"onConnect called for connection to: {Connection.Address}:{Connection.Port}")
 
@@ -640,18 +2915,17 @@ class BasePlugin:
     def onCommand(self, Unit, Command, Level, Hue):
         Domoticz.Debug(f"onCommand called for Unit:{str(Unit)} Command:{str(Command)} Level: {str(Level)}")
 
-        argument_list = locals()
-        argument_list.pop('self', None)
-
-        self.process_socket_message(
-            *self.dev_lists['WRIT_PARAMS'][Unit].prepare_data_to_send(
-                available_writes=self.available_writes,
-                **argument_list))
-        self.update('READ_PARAMS')
+        controller = next((controller for controller in self.controllers
+                           if Unit in controller.dev_lists['WRIT_PARAMS']), None)
+        if controller is None:
+            Domoticz.Error(f"Unit {Unit} can not be controlled, it is not installed according to the controller.")
+            return
+        controller.command(Unit, Command, Level, Hue)
 
     def onHeartbeat(self):
         Domoticz.Debug("onHeartbeat called.")
-        self.update_all()
+        for controller in self.controllers:
+            controller.heartbeat()
 
 
 global _plugin
@@ -706,7 +2980,9 @@ def update_device(Unit: int = None, nValue: int = None, sValue: str = None, Imag
     # Make sure that the Domoticz device still exists (they can be deleted) before updating it
     if Unit not in Devices:
         global _plugin
-        _plugin.create_devices()
+        _plugin.reconcile_unit(Unit)
+        if Unit not in Devices:
+            return
 
     largs = {}
     update_needed = False
@@ -738,11 +3014,13 @@ def update_device(Unit: int = None, nValue: int = None, sValue: str = None, Imag
         largs["Options"] = Options
     if TimedOut is not None and TimedOut != Devices[Unit].TimedOut:
         largs["TimedOut"] = TimedOut
-    if Name is not None and Name != Devices[Unit].Name and bool(re.search(Devices[Unit].Name.replace(f"{Parameters['Name']} - " if f"{Parameters['Name']} - " in Devices[Unit].Name else "", ""), _IDS_STR)):
+    # Domoticz shows the hardware name in front of the name the plugin gives.
+    if Name is not None and f"{Parameters['Name']} - {Name}" != Devices[Unit].Name and \
+            own_name(Devices[Unit].Name) in _IDS_NAMES:
         largs["Name"] = f"{Parameters['Name']} - {Name}"
     if Type is not None and Type != Devices[Unit].Type:
         largs["Type"] = Type
-    if Subtype is not None:
+    if Subtype is not None and Subtype != getattr(Devices[Unit], 'SubType', None):
         largs["Subtype"] = Subtype
     if Switchtype is not None and Switchtype != getattr(Devices[Unit], 'SwitchType', None):  # Changed here
         largs["SwitchType"] = Switchtype  # And here
@@ -764,6 +3042,24 @@ def update_device(Unit: int = None, nValue: int = None, sValue: str = None, Imag
 
 
 # Generic helper functions
+def own_name(device_name: str) -> str:
+    """Device name without the hardware name and controller label the plugin puts in front."""
+    name = device_name.replace(f"{Parameters['Name']} - ", "", 1)
+    if name.startswith('[') and '] ' in name:
+        name = name.split('] ', 1)[1]
+    return name
+
+
+def load_configuration(key: str, default=None):
+    return Domoticz.Configuration().get(key, default)
+
+
+def save_configuration(key: str, value):
+    configuration = Domoticz.Configuration()
+    configuration[key] = value
+    Domoticz.Configuration(configuration)
+
+
 def dump_config_to_log():
     for x in Parameters:
         if Parameters[x] != "":
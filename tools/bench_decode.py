@@ -0,0 +1,91 @@
+"""
+Micro-benchmark of the per-poll decode cost of READ_CALCUL/READ_PARAMS replies.
+
+Compares the former one recv(4) + struct.unpack per value loop with the framed
+reader (recv_into a preallocated buffer, single bulk decode) used by the plugin.
+
+Usage:
+    python tools/bench_decode.py [--rounds 200] [--params 1100] [--calcul 260]
+"""
+import argparse
+import os
+import socket
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from domoticz_shim import DomoticzShim  # noqa: E402
+
+plugin = DomoticzShim().load()
+
+
+def build_reply(command: int, length: int) -> bytes:
+    if command == plugin.SOCKET_COMMANDS['READ_CALCUL']:
+        header = struct.pack('!iii', command, 0, length)
+    else:
+        header = struct.pack('!ii', command, length)
+    return header + struct.pack(f'!{length}i', *range(length))
+
+
+def legacy_read(sock, command: int):
+    """Decode loop as it was before the framed reader."""
+    if struct.unpack('!i', sock.recv(4))[0] != command:
+        return None
+    stat = 0
+    if command == plugin.SOCKET_COMMANDS['READ_PARAMS']:
+        length = struct.unpack('!i', sock.recv(4))[0]
+    else:
+        stat = struct.unpack('!i', sock.recv(4))[0]
+        length = struct.unpack('!i', sock.recv(4))[0]
+    data_list = []
+    for i in range(length):
+        data_list.append(struct.unpack('!i', sock.recv(4))[0])
+    return command, stat, length, data_list
+
+
+def bench(reader, replies: list, rounds: int) -> float:
+    server, client = socket.socketpair()
+    try:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for command, reply in replies:
+                server.sendall(reply)
+                reader(client, command)
+        return (time.perf_counter() - start) / rounds
+    finally:
+        server.close()
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--params', type=int, default=1100, help='READ_PARAMS payload length')
+    parser.add_argument('--calcul', type=int, default=260, help='READ_CALCUL payload length')
+    args = parser.parse_args()
+
+    replies = [(plugin.SOCKET_COMMANDS['READ_CALCUL'], build_reply(plugin.SOCKET_COMMANDS['READ_CALCUL'], args.calcul)),
+               (plugin.SOCKET_COMMANDS['READ_PARAMS'], build_reply(plugin.SOCKET_COMMANDS['READ_PARAMS'], args.params))]
+
+    # Both readers have to agree before timing them.
+    for command, reply in replies:
+        server, client = socket.socketpair()
+        server.sendall(reply)
+        expected = legacy_read(client, command)
+        server.sendall(reply)
+        assert list(plugin.read_frame(client, command)[3]) == expected[3]
+        server.close()
+        client.close()
+
+    before = bench(legacy_read, replies, args.rounds)
+    after = bench(plugin.read_frame, replies, args.rounds)
+    print(f"values per poll: {args.calcul + args.params}")
+    print(f"before (recv(4) per value): {before * 1e3:8.3f} ms/poll")
+    print(f"after  (framed bulk read):  {after * 1e3:8.3f} ms/poll")
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
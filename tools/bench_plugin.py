@@ -0,0 +1,162 @@
+"""
+Regression benchmarks of the plugin hot paths, run headless through the Domoticz shim.
+
+Measures time and allocations of:
+    decode            parsing a READ_CALCUL and a READ_PARAMS reply
+    update_changed    applying a poll where every value changed
+    update_unchanged  applying a poll identical to the previous one
+    create_devices    building the device table and creating every device
+    warm_start        building the device table when the device layout is unchanged
+    reconcile         reconciling an unchanged, complete device set
+    on_command        validating, queueing and showing a setpoint write
+
+Each result is compared with tools/bench_baseline.json, the run fails (exit code 1)
+when a path got slower or allocates more than the tolerance allows.
+Timings depend on the machine, refresh the baseline with --update-baseline there.
+
+Usage:
+    python tools/bench_plugin.py [--tolerance 0.5] [--update-baseline]
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+import tracemalloc
+
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TOOLS)
+
+from domoticz_shim import DomoticzShim  # noqa: E402
+from luxtronik_emulator import default_data  # noqa: E402
+
+BASELINE_PATH = os.path.join(TOOLS, 'bench_baseline.json')
+
+
+def measure(function, number: int, repeat: int = 5) -> dict:
+    function()
+    best = min(timed(function, number) for _ in range(repeat))
+
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'time_us': round(best / number * 1e6, 3), 'peak_kib': round((peak - start) / 1024, 3)}
+
+
+def timed(function, number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        function()
+    return time.perf_counter() - start
+
+
+def build(shim: DomoticzShim):
+    plugin = shim.load()
+    base = plugin.Controller(0, '127.0.0.1', 1, plugin.parse_options(shim.parameters['Mode4']))
+    plugin._plugin.controllers = [base]
+    base.create_devices()
+    schedule = plugin.PollSchedule({'READ_CALCUL': 10})
+    # Never started, onCommand only queues into it.
+    base.poller = plugin.Poller(plugin.LuxtronikSession('127.0.0.1', 1), schedule, base.snapshots, 1.0)
+    return plugin, base
+
+
+def run_benchmarks() -> dict:
+    shim = DomoticzShim()
+    plugin, base = build(shim)
+    data = default_data()
+    calculations = plugin.array(plugin.INT32_TYPECODE, data['calculations'])
+    parameters = plugin.array(plugin.INT32_TYPECODE, data['parameters'])
+    changed = plugin.array(plugin.INT32_TYPECODE, (value + 10 for value in data['calculations']))
+
+    replies = (struct.pack(f'!iii{len(calculations)}i', 3004, 0, len(calculations), *calculations) +
+               struct.pack(f'!ii{len(parameters)}i', 3003, len(parameters), *parameters))
+
+    def decode():
+        protocol = plugin.LuxtronikProtocol()
+        protocol.expect(3004)
+        protocol.expect(3003)
+        protocol.feed(replies)
+
+    polls = [calculations, changed]
+
+    def update_changed():
+        polls.reverse()
+        base.update('READ_CALCUL', polls[0])
+
+    def update_unchanged():
+        base.update('READ_CALCUL', calculations)
+
+    def create_devices():
+        shim.devices.clear()
+        base.create_devices()
+
+    levels = [500, 550]
+
+    def on_command():
+        levels.reverse()
+        plugin.onCommand(7, 'Set Level', levels[0] / 10, 0)
+
+    results = {
+        'decode': measure(decode, 200),
+        'update_changed': measure(update_changed, 200),
+    }
+    base.update('READ_CALCUL', calculations)
+    results['update_unchanged'] = measure(update_unchanged, 2000)
+    results['create_devices'] = measure(create_devices, 50)
+    results['warm_start'] = measure(base.create_devices, 50)
+    results['reconcile'] = measure(base.reconcile, 200)
+    results['on_command'] = measure(on_command, 200)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        if result['time_us'] > reference['time_us'] * (1 + tolerance):
+            regressions.append(f"{name}: {result['time_us']} us vs baseline {reference['time_us']} us")
+        # Allocations are deterministic, a small absolute slack absorbs interpreter noise.
+        if result['peak_kib'] > reference['peak_kib'] * (1 + tolerance) + 1:
+            regressions.append(f"{name}: {result['peak_kib']} KiB vs baseline {reference['peak_kib']} KiB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed relative regression')
+    parser.add_argument('--update-baseline', action='store_true', help='store this run as the baseline')
+    args = parser.parse_args()
+
+    results = run_benchmarks()
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    for name, result in results.items():
+        reference = baseline.get(name, {})
+        print(f"{name:18} {result['time_us']:10.3f} us (baseline {reference.get('time_us', '-')})"
+              f" {result['peak_kib']:9.3f} KiB (baseline {reference.get('peak_kib', '-')})")
+
+    if args.update_baseline:
+        with open(BASELINE_PATH, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=4, sort_keys=True)
+            baseline_file.write('\n')
+        print(f"baseline written to {BASELINE_PATH}")
+        return
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("Regressions:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
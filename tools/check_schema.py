@@ -0,0 +1,123 @@
+"""
+Validates a device schema file (devices.json) the way the plugin compiles it.
+
+Prints every problem found and exits non zero when the schema does not validate.
+--self-test instead feeds malformed schemas through the validation and fails
+when one is not reported as a schema error (or crashes it).
+
+Usage:
+    python tools/check_schema.py [devices.json]
+    python tools/check_schema.py --self-test
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from domoticz_shim import DomoticzShim  # noqa: E402
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'devices.json')
+
+VALID_DEVICE = {'unit': 1, 'name': 'Flow temperature', 'command': 'READ_CALCUL', 'index': 10,
+                'read': {'conversion': 'float', 'divider': 10}, 'device': {'TypeName': 'Temperature'}}
+VALID_METRIC = {'name': 'Spread', 'function': 'difference', 'inputs': [10, 11]}
+
+
+def device(**changes) -> dict:
+    result = copy.deepcopy(VALID_DEVICE)
+    result.update(changes)
+    return {'devices': [result], 'metrics': [VALID_METRIC]}
+
+
+def metric(**changes) -> dict:
+    result = copy.deepcopy(VALID_METRIC)
+    result.update(changes)
+    return {'devices': [VALID_DEVICE], 'metrics': [result]}
+
+
+MALFORMED = {
+    'unit list': device(unit=[1]),
+    'unit bool': device(unit=True),
+    'unit out of range': device(unit=0),
+    'command list': device(command=['READ_CALCUL']),
+    'index list': device(index=[10]),
+    'index negative': device(index=-1),
+    'conversion list': device(read={'conversion': ['float']}),
+    'conversion dict': device(read={'conversion': {'float': 1}}),
+    'divider zero': device(read={'conversion': 'float', 'divider': 0}),
+    'divider text': device(read={'conversion': 'float', 'divider': '10'}),
+    'power index list': device(read={'conversion': 'cop', 'power_index': [1]}),
+    'modes not indices': device(read={'conversion': 'power_split', 'state_index': 80, 'modes': [[0]]}),
+    'energy list': device(read={'conversion': 'power', 'energy': ['kWh']}),
+    'metric list': device(index=None, read={'conversion': 'metric', 'metric': ['Spread']}),
+    'energy on parameters': device(command='READ_PARAMS', read={'conversion': 'power', 'energy': 'kWh'}),
+    'power split on parameters': device(command='READ_PARAMS',
+                                        read={'conversion': 'power_split', 'state_index': 80, 'modes': [0]}),
+    'metric on parameters': device(command='READ_PARAMS', index=None,
+                                   read={'conversion': 'metric', 'metric': 'Spread'}),
+    'metric unknown': device(index=None, read={'conversion': 'metric', 'metric': 'Missing'}),
+    'texts not texts': device(index=None, read={'conversion': 'metric', 'metric': 'Spread', 'texts': [1]}),
+    'write conversion list': device(command='READ_PARAMS', read={'conversion': 'number'},
+                                    write={'conversion': ['level'], 'divider': 1, 'allowed': [1]}),
+    'write index list': device(command='READ_PARAMS', index=[3], read={'conversion': 'number'},
+                               write={'conversion': 'switch'}),
+    'write twice': {'devices': [
+        dict(VALID_DEVICE, command='READ_PARAMS', read={'conversion': 'number'}, write={'conversion': 'switch'}),
+        dict(VALID_DEVICE, unit=2, command='READ_PARAMS', read={'conversion': 'number'},
+             write={'conversion': 'switch'})]},
+    'metric name list': metric(name=['Spread']),
+    'metric function list': metric(function=['difference']),
+    'metric inputs dict': metric(inputs=[{'index': 10}]),
+    'metric factor text': metric(function='scale', inputs=[10], factor='2'),
+    'device not an object': {'devices': [[VALID_DEVICE]]},
+    'devices not a list': {'devices': {'1': VALID_DEVICE}},
+}
+
+
+def self_test(plugin) -> int:
+    failures = 0
+    try:
+        plugin.compile_schema({'devices': [VALID_DEVICE], 'metrics': [VALID_METRIC]})
+    except plugin.SchemaError as msg:
+        print(f"FAIL valid schema: {msg}")
+        failures += 1
+    for name, schema in MALFORMED.items():
+        try:
+            plugin.compile_schema(schema)
+        except plugin.SchemaError as msg:
+            print(f"ok   {name}: {msg}")
+            continue
+        except Exception as msg:
+            print(f"FAIL {name}: {type(msg).__name__}: {msg}")
+        else:
+            print(f"FAIL {name}: accepted")
+        failures += 1
+    print(f"{len(MALFORMED) + 1 - failures}/{len(MALFORMED) + 1} schema checks passed")
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('schema', nargs='?', default=SCHEMA_PATH, help='device schema file, default devices.json')
+    parser.add_argument('--self-test', action='store_true', help='check that malformed schemas are rejected')
+    args = parser.parse_args()
+
+    plugin = DomoticzShim().load()
+    if args.self_test:
+        sys.exit(self_test(plugin))
+    try:
+        with open(args.schema, 'rb') as schema_file:
+            compiled = plugin.compile_schema(json.load(schema_file))
+    except (OSError, ValueError) as msg:
+        for problem in str(msg).split('; '):
+            print(problem)
+        sys.exit(1)
+    print(f"{args.schema}: {len(compiled['devices'])} devices, {len(compiled['metrics'])} metrics, "
+          f"{sum(len(values) for values in compiled['indices'].values())} values read")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Headless stand-in for the Domoticz Python plugin runtime.
+
+Installs a fake 'Domoticz' module, then loads plugin.py unchanged with its own
+Devices and Parameters, so the plugin callbacks can be driven and timed outside
+of Domoticz:
+
+    shim = DomoticzShim(Address='127.0.0.1', Port='8889')
+    plugin = shim.load()
+    plugin.onStart()
+    plugin.onHeartbeat()
+    plugin.onStop()
+"""
+import importlib.util
+import os
+import sys
+import types
+
+PLUGIN_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'plugin.py')
+
+DEFAULT_PARAMETERS = {
+    'Name': 'Luxtronik',
+    'HardwareID': 1,
+    'HomeFolder': os.path.dirname(PLUGIN_PATH) + os.sep,
+    'Address': '127.0.0.1',
+    'Port': '8889',
+    'Mode1': '',
+    'Mode2': '25',
+    'Mode3': '0',
+    'Mode4': '',
+    'Mode5': '',
+    'Mode6': '0',
+}
+
+
+class Device:
+    """Device as seen by a plugin, Update only records what a real one would store."""
+    def __init__(self, shim, Name='', Unit=0, TypeName='', Type=0, Subtype=0, Switchtype=0, Image=0,
+                 Options=None, Used=0, Description='', **_kwargs):
+        self._shim = shim
+        self.ID = 0
+        self.Unit = Unit
+        self.Name = f"{shim.parameters['Name']} - {Name}"
+        self.TypeName = TypeName
+        self.Type = Type
+        self.SubType = Subtype
+        self.SwitchType = Switchtype
+        self.Image = Image
+        self.Options = Options or {}
+        self.Used = Used
+        self.Description = Description
+        self.nValue = 0
+        self.sValue = ''
+        self.LastLevel = 0
+        self.SignalLevel = 12
+        self.BatteryLevel = 255
+        self.TimedOut = 0
+        self.Color = ''
+        self.SuppressTriggers = 0
+        self.updates = 0
+
+    def Create(self):
+        self.ID = len(self._shim.devices) + 1
+        self._shim.devices[self.Unit] = self
+
+    def Update(self, nValue=None, sValue=None, Subtype=None, SwitchType=None, **kwargs):
+        self.updates += 1
+        self._shim.updates += 1
+        if nValue is not None:
+            self.nValue = nValue
+            self.LastLevel = nValue
+        if sValue is not None:
+            self.sValue = sValue
+        if Subtype is not None:
+            self.SubType = Subtype
+        if SwitchType is not None:
+            self.SwitchType = SwitchType
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+    def Delete(self):
+        self._shim.devices.pop(self.Unit, None)
+
+    def __str__(self):
+        return f"Unit: {self.Unit}, Name: '{self.Name}', nValue: {self.nValue}, sValue: '{self.sValue}'"
+
+
+class DomoticzShim:
+    def __init__(self, echo: bool = False, **parameters):
+        self.parameters = dict(DEFAULT_PARAMETERS, **parameters)
+        self.devices = {}
+        self.configuration = {}
+        self.log = []
+        self.errors = []
+        self.heartbeat = None
+        self.updates = 0
+        self.echo = echo
+        self.module = self.build_module()
+
+    def build_module(self) -> types.ModuleType:
+        module = types.ModuleType('Domoticz')
+
+        def logger(level):
+            def log(message):
+                self.log.append((level, message))
+                if level == 'Error':
+                    self.errors.append(message)
+                if self.echo:
+                    print(f"{level}: {message}")
+            return log
+
+        module.Debug = logger('Debug')
+        module.Log = logger('Log')
+        module.Status = logger('Status')
+        module.Error = logger('Error')
+        module.Debugging = lambda level: None
+        module.Heartbeat = lambda seconds: setattr(self, 'heartbeat', seconds)
+        module.Device = lambda **kwargs: Device(self, **kwargs)
+
+        def configuration(values=None):
+            if values is not None:
+                self.configuration = dict(values)
+            return dict(self.configuration)
+        module.Configuration = configuration
+        return module
+
+    def load(self, path: str = PLUGIN_PATH) -> types.ModuleType:
+        """Imports a fresh copy of plugin.py bound to this shim."""
+        sys.modules['Domoticz'] = self.module
+        spec = importlib.util.spec_from_file_location('plugin', path)
+        plugin = importlib.util.module_from_spec(spec)
+        # Domoticz provides these as globals of the plugin module.
+        plugin.Devices = self.devices
+        plugin.Parameters = self.parameters
+        sys.modules['plugin'] = plugin
+        spec.loader.exec_module(plugin)
+        return plugin
+
+
+def install() -> DomoticzShim:
+    """Makes 'import plugin' work for tools that only need the plugin helpers."""
+    shim = DomoticzShim()
+    sys.modules['Domoticz'] = shim.module
+    return shim
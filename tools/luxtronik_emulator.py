@@ -0,0 +1,272 @@
+"""
+Local stand-in for a Luxtronik2 controller speaking the socket protocol on port 8889.
+
+Serves WRIT_PARAMS (3002), READ_PARAMS (3003), READ_CALCUL (3004) and READ_VISIBI (3005)
+from configurable arrays and can misbehave like controllers in the field: slow replies,
+replies split into small TCP segments, connection resets, hung replies and a limit of
+concurrent clients.
+
+Usage:
+    python tools/luxtronik_emulator.py serve [--port 8889] [faults...]
+        Runs the emulator until interrupted, point the plugin at it.
+
+    python tools/luxtronik_emulator.py bench [--polls 200] [faults...]
+        Runs the emulator in process and polls it through the plugin session,
+        reporting poll latency percentiles and throughput.
+
+Data file (--data) is JSON with optional "parameters", "calculations" and "visibilities"
+lists, missing ones are filled with a plausible default installation.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import socketserver
+import statistics
+import struct
+import sys
+import threading
+import time
+
+WRIT_PARAMS = 3002
+READ_PARAMS = 3003
+READ_CALCUL = 3004
+READ_VISIBI = 3005
+
+PARAMETERS_COUNT = 1126
+CALCULATIONS_COUNT = 300
+VISIBILITIES_COUNT = 355
+
+FIRMWARE = 'V3.88.1'
+
+
+def default_data() -> dict:
+    parameters = [0] * PARAMETERS_COUNT
+    parameters[1] = 0       # Temp +-
+    parameters[3] = 0       # Heating mode, automatic
+    parameters[4] = 0       # Hot water mode, automatic
+    parameters[105] = 500   # DHW temp target
+    parameters[108] = 0     # Cooling
+
+    calculations = [0] * CALCULATIONS_COUNT
+    calculations[10] = 352  # Heat supply temp
+    calculations[11] = 301  # Heat return temp
+    calculations[12] = 300  # Return temp target
+    calculations[15] = 54   # Outside temp
+    calculations[16] = 61   # Outside temp avg
+    calculations[17] = 487  # DHW temp
+    calculations[19] = 71   # WP source in temp
+    calculations[20] = 32   # WP source out temp
+    calculations[80] = 0    # Working mode, heating
+    calculations[81:81 + len(FIRMWARE)] = [ord(char) for char in FIRMWARE]
+    calculations[173] = 1200  # Flow
+    calculations[227] = 215   # Room temp
+    calculations[228] = 210   # Room temp target
+    calculations[231] = 45    # Compressor freq
+    calculations[257] = 4500  # Heat output
+    calculations[268] = 1500  # Power input
+
+    visibilities = [1] * VISIBILITIES_COUNT
+    visibilities[5] = 0     # No cooling
+    visibilities[8] = 0     # No mixing circuit 2
+
+    return {
+        'parameters': parameters,
+        'calculations': calculations,
+        'visibilities': visibilities,
+    }
+
+
+class Emulator(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, data: dict, args):
+        super().__init__(address, ClientHandler)
+        self.lock = threading.Lock()
+        self.parameters = list(data['parameters'])
+        self.calculations = list(data['calculations'])
+        self.visibilities = list(data['visibilities'])
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.clients = 0
+        self.requests = 0
+
+    def reply(self, command: int, address: int, value: int) -> bytes:
+        with self.lock:
+            self.requests += 1
+            if command == WRIT_PARAMS:
+                if not self.args.readonly and 0 <= address < len(self.parameters):
+                    self.parameters[address] = value
+                return struct.pack('!ii', command, value)
+            if command == READ_PARAMS:
+                values = self.parameters
+                return struct.pack(f'!ii{len(values)}i', command, len(values), *values)
+            if command == READ_CALCUL:
+                values = self.calculations
+                return struct.pack(f'!iii{len(values)}i', command, 0, len(values), *values)
+            values = self.visibilities
+            return struct.pack(f'!ii{len(values)}b', command, len(values), *values)
+
+    def roll(self, probability: float) -> bool:
+        with self.lock:
+            return probability > 0 and self.random.random() < probability
+
+
+class ClientHandler(socketserver.BaseRequestHandler):
+    def setup(self):
+        with self.server.lock:
+            self.server.clients += 1
+            self.accepted = self.server.clients <= self.server.args.max_clients
+
+    def finish(self):
+        with self.server.lock:
+            self.server.clients -= 1
+
+    def recv_exact(self, size: int) -> bytes:
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError
+            data += chunk
+        return data
+
+    def send(self, reply: bytes):
+        args = self.server.args
+        if not args.chunk:
+            self.request.sendall(reply)
+            return
+        for start in range(0, len(reply), args.chunk):
+            self.request.sendall(reply[start:start + args.chunk])
+            if args.chunk_delay:
+                time.sleep(args.chunk_delay)
+
+    def handle(self):
+        args = self.server.args
+        if not self.accepted:
+            # Busy controllers drop the extra clients right away.
+            return
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        served = 0
+        try:
+            while True:
+                command, address = struct.unpack('!ii', self.recv_exact(8))
+                value = 0
+                if command == WRIT_PARAMS:
+                    value = struct.unpack('!i', self.recv_exact(4))[0]
+                elif command not in (READ_PARAMS, READ_CALCUL, READ_VISIBI):
+                    return
+
+                if self.server.roll(args.stall_probability):
+                    # Hung controller, never answers but frees its client slot once the client gives up.
+                    while self.request.recv(4096):
+                        pass
+                    return
+                if self.server.roll(args.reset_probability) or (args.reset_every and served >= args.reset_every):
+                    self.request.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+                    return
+                if args.latency or args.jitter:
+                    time.sleep(args.latency + self.server.random.uniform(0, args.jitter))
+
+                self.send(self.server.reply(command, address, value))
+                served += 1
+        except (ConnectionError, OSError):
+            return
+
+
+def load_data(path: str) -> dict:
+    data = default_data()
+    if path:
+        with open(path) as data_file:
+            data.update(json.load(data_file))
+    return data
+
+
+def start(args, port: int) -> Emulator:
+    server = Emulator((args.host, port), load_data(args.data), args)
+    threading.Thread(target=server.serve_forever, name='emulator', daemon=True).start()
+    return server
+
+
+def serve(args):
+    server = start(args, args.port)
+    print(f"Luxtronik2 emulator listening on {args.host}:{server.server_address[1]}")
+    try:
+        while True:
+            time.sleep(60)
+            print(f"requests served: {server.requests}")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+def bench(args):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from domoticz_shim import DomoticzShim
+    plugin = DomoticzShim().load()
+
+    server = start(args, 0)
+    session = plugin.LuxtronikSession(args.host, server.server_address[1])
+    latencies = []
+    failures = timeouts = 0
+    start_time = time.perf_counter()
+    for _ in range(args.polls):
+        poll_start = time.perf_counter()
+        # Like the plugin poller, a hung reply must not stall the bench.
+        deadline = time.monotonic() + args.poll_timeout
+        try:
+            session.request(READ_CALCUL, deadline=deadline)
+            session.request(READ_PARAMS, deadline=deadline)
+        except TimeoutError:
+            timeouts += 1
+            failures += 1
+            continue
+        except OSError:
+            failures += 1
+            continue
+        latencies.append(time.perf_counter() - poll_start)
+    elapsed = time.perf_counter() - start_time
+    session.close()
+    server.shutdown()
+
+    if not latencies:
+        print(f"all {failures} polls failed")
+        return
+    latencies.sort()
+    print(f"polls: {len(latencies)} ok, {failures} failed ({timeouts} timed out) in {elapsed:.3f} s "
+          f"({len(latencies) / elapsed:.1f} polls/s)")
+    print(f"latency p50 {statistics.median(latencies) * 1e3:.3f} ms, "
+          f"p95 {latencies[int(0.95 * (len(latencies) - 1))] * 1e3:.3f} ms, "
+          f"max {latencies[-1] * 1e3:.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('mode', choices=('serve', 'bench'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8889)
+    parser.add_argument('--data', help='JSON file with parameters/calculations/visibilities lists')
+    parser.add_argument('--polls', type=int, default=200, help='bench: number of READ_CALCUL + READ_PARAMS polls')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the fault injection')
+    parser.add_argument('--poll-timeout', type=float, default=2.0, help='bench: seconds one poll may take')
+    faults = parser.add_argument_group('faults')
+    faults.add_argument('--latency', type=float, default=0.0, help='seconds before every reply')
+    faults.add_argument('--jitter', type=float, default=0.0, help='random extra latency up to this many seconds')
+    faults.add_argument('--chunk', type=int, default=0, help='send replies in segments of this many bytes')
+    faults.add_argument('--chunk-delay', type=float, default=0.0, help='seconds between segments, a slow link')
+    faults.add_argument('--reset-every', type=int, default=0, help='reset the connection after this many replies')
+    faults.add_argument('--reset-probability', type=float, default=0.0, help='chance to reset instead of replying')
+    faults.add_argument('--stall-probability', type=float, default=0.0, help='chance to never reply')
+    faults.add_argument('--max-clients', type=int, default=4, help='concurrent clients served, others are dropped')
+    faults.add_argument('--readonly', action='store_true', help='acknowledge writes without applying them')
+    args = parser.parse_args()
+
+    if args.mode == 'serve':
+        serve(args)
+    else:
+        bench(args)
+
+
+if __name__ == '__main__':
+    main()
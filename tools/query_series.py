@@ -0,0 +1,71 @@
+"""
+Range queries on the calculations series store of the plugin (advanced option series=<file>).
+
+Prints the values of the given calculation indices between two times as CSV, one
+row per poll. Times are seconds since the epoch, 'YYYY-mm-dd HH:MM[:SS]' local time,
+or negative seconds relative to now.
+
+Usage:
+    python tools/query_series.py FILE --index 10 --index 11 [--start -3600] [--end ...]
+    python tools/query_series.py FILE --info
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from domoticz_shim import DomoticzShim  # noqa: E402
+
+
+def parse_time(text: str):
+    if text is None:
+        return None
+    try:
+        value = float(text)
+    except ValueError:
+        for pattern in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+            try:
+                return time.mktime(time.strptime(text, pattern))
+            except ValueError:
+                continue
+        raise argparse.ArgumentTypeError(f"can not parse time {text}")
+    return time.time() + value if value < 0 else value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('store', help='series store made with the series advanced option')
+    parser.add_argument('--index', type=int, action='append', default=[], help='calculation index, repeatable')
+    parser.add_argument('--start', type=parse_time, default=None)
+    parser.add_argument('--end', type=parse_time, default=None)
+    parser.add_argument('--info', action='store_true', help='print the store layout and time span')
+    args = parser.parse_args()
+
+    plugin = DomoticzShim().load()
+    store = plugin.SeriesStore(args.store, 0, readonly=True)
+    try:
+        if args.info or not args.index:
+            span = ''
+            if store.count:
+                span = (f", {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(store.time_at(0)))} to "
+                        f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(store.time_at(store.count - 1)))}")
+            print(f"{args.store}: indices 0-{store.width - 1}, {store.count}/{store.capacity} rows{span}")
+            return
+
+        writer = csv.writer(sys.stdout)
+        writer.writerow(['time'] + [f'calc_{index}' for index in args.index])
+        if len(args.index) == 1:
+            for taken_at, value in store.series(args.index[0], args.start, args.end):
+                writer.writerow([f'{taken_at:.3f}', value])
+        else:
+            for taken_at, values in store.rows(args.start, args.end):
+                writer.writerow([f'{taken_at:.3f}'] + [values[index] for index in args.index])
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Replays frames recorded by the plugin (advanced option record=<file>) through update().
+
+Loads plugin.py through the Domoticz shim, creates the devices of one controller and
+feeds every recorded READ_CALCUL/READ_PARAMS frame to it, at the recorded pace scaled
+by --speed, or as fast as possible with --speed 0. Reports the time spent in update()
+and the device updates it made, for reproducible performance tests and post-mortems
+of field incidents.
+
+Usage:
+    python tools/replay_frames.py LOG [--speed 0] [--options 'max_age=300;...'] [--echo]
+    python tools/replay_frames.py LOG --dump N
+        Prints record N (0 based, negative from the end) decoded.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from domoticz_shim import DomoticzShim  # noqa: E402
+
+
+def replay(plugin, shim: DomoticzShim, log, options: str, speed: float):
+    controller = plugin.Controller(0, '127.0.0.1', 1, plugin.parse_options(options))
+    plugin._plugin.controllers = [controller]
+    controller.create_devices()
+    shim.updates = 0
+
+    timings = {}
+    first_taken_at = previous_taken_at = None
+    started = time.perf_counter()
+    for taken_at, message, values in log:
+        if first_taken_at is None:
+            first_taken_at = taken_at
+        if speed and previous_taken_at is not None and taken_at > previous_taken_at:
+            time.sleep((taken_at - previous_taken_at) / speed)
+        previous_taken_at = taken_at
+
+        update_started = time.perf_counter()
+        controller.update(message, values)
+        timings.setdefault(message, []).append(time.perf_counter() - update_started)
+    elapsed = time.perf_counter() - started
+
+    frames = sum(len(values) for values in timings.values())
+    if not frames:
+        print("no frames recorded")
+        return
+    print(f"replayed {frames} frames recorded over {previous_taken_at - first_taken_at:.0f} s "
+          f"in {elapsed:.3f} s, {shim.updates} device updates")
+    for message, values in sorted(timings.items()):
+        values.sort()
+        print(f"{message}: {len(values)} frames, update p50 {statistics.median(values) * 1e6:.1f} us, "
+              f"p95 {values[int(0.95 * (len(values) - 1))] * 1e6:.1f} us, max {values[-1] * 1e6:.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('log', help='recording made with the record advanced option')
+    parser.add_argument('--speed', type=float, default=0.0, help='replay speed factor, 0 replays without pauses')
+    parser.add_argument('--options', default='', help='advanced options of the replaying plugin')
+    parser.add_argument('--dump', type=int, default=None, help='print this record instead of replaying')
+    parser.add_argument('--echo', action='store_true', help='print the plugin log')
+    args = parser.parse_args()
+
+    shim = DomoticzShim(echo=args.echo, Mode4=args.options)
+    plugin = shim.load()
+    log = plugin.FrameLog(args.log)
+    try:
+        size = os.path.getsize(args.log)
+        print(f"{args.log}: {len(log)} records, {size} bytes, {size / max(len(log), 1):.0f} bytes per record")
+        if args.dump is not None:
+            taken_at, message, values = log.frame(args.dump % len(log))
+            print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(taken_at))} {message}: {list(values)}")
+        else:
+            replay(plugin, shim, log, args.options, args.speed)
+    finally:
+        log.close()
+
+
+if __name__ == '__main__':
+    main()